@@ -0,0 +1,26 @@
+### Small timing helpers shared by the modules' benchmark() functions
+# Standard library only, so library modules can import it without pulling in the
+# timeit_bench runner (and its cases).
+#
+# usage:
+#   from bench_helpers import best_time, worker_counts
+#   t = best_time(lambda: np.sin(x, out=out), repeat=5)
+#   for w in worker_counts(): ...            # 1, 2, 4, ... up to os.cpu_count()
+import os
+import time
+
+
+def best_time(call, repeat=3):
+    """Best wall time of repeat calls to call(), in seconds."""
+    times = []
+    for r in range(repeat):
+        t0 = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def worker_counts(cores=None):
+    """1, 2, 4, ... up to the number of cores (at least [1])."""
+    cores = cores or os.cpu_count() or 1
+    return [w for w in (1, 2, 4, 8, 16, 32, 64) if w <= cores]
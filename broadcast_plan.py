@@ -0,0 +1,172 @@
+### Broadcast planner: reduce a broadcast result tile by tile
+# In 2.5-broadcasting.py, a + b with shapes (3, 1) and (3,) stretches both operands into a full
+# 3 x 3 result. With 1e5-long operands the same line quietly asks for 80 GB, even when all that
+# is wanted afterwards is (a + b).sum(axis=0) or (a + b).min(). plan() records the operation
+# instead: it checks the operand shapes, works out the result's shape, dtype and size up front,
+# and runs reductions one tile of the broadcast result at a time. Only asking for the full array
+# (materialize() / np.asarray) can still fail -- with a TooLarge error saying how big it would be.
+#
+# usage:
+#   p = plan(np.add, a[:, None], b)          # nothing computed yet
+#   p.shape, p.nbytes                        # (100000, 100000), 80000000000
+#   p.sum(axis=0)                            # == (a[:, None] + b).sum(axis=0), in 8 MB tiles
+#   p.min(), p.mean(axis=1), p.reduce(np.logical_or, axis=1)
+#   plan(lambda x, y: np.sin(x) ** 10 + np.cos(10 + y * x) * np.cos(x), x, y[:, None]).max()
+#   np.asarray(p)                            # TooLarge: ... would need 74.5 GB
+import numpy as np
+
+TILE_BYTES = 8 * 2 ** 20        # size of one broadcast result tile
+MAX_BYTES = 2 ** 30             # materialize() refuses results bigger than this
+
+
+class TooLarge(MemoryError):
+    """The full broadcast result was requested but exceeds the size limit."""
+
+
+def _slice_operand(op, ndim, index):
+    # cut this tile out of an operand, keeping its stretched (size-1) axes whole
+    if not isinstance(op, np.ndarray):
+        return op
+    pad = ndim - op.ndim
+    return op[tuple(slice(None) if op.shape[k] == 1 else index[pad + k] for k in range(op.ndim))]
+
+
+class BroadcastPlan(object):
+    """func(*operands) over the broadcast of the operands, evaluated lazily in tiles."""
+
+    def __init__(self, func, *operands, tile_bytes=TILE_BYTES):
+        self.func = func
+        self.operands = [np.asarray(op) if isinstance(op, (list, tuple)) else op for op in operands]
+        arrays = [op for op in self.operands if isinstance(op, np.ndarray)]
+        try:
+            self.shape = np.broadcast_shapes(*[a.shape for a in arrays])
+        except ValueError:
+            raise ValueError('operands could not be broadcast together with shapes %s'
+                             % ' '.join(str(a.shape) for a in arrays))
+        probe = func(*[op.reshape(-1)[:1].reshape((1,) * op.ndim) if isinstance(op, np.ndarray) and op.size
+                       else op for op in self.operands])
+        self.dtype = np.asarray(probe).dtype
+        self.tile_bytes = tile_bytes
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __repr__(self):
+        return '<BroadcastPlan %s %s, %.3g GB if materialized>' % (self.shape, self.dtype, self.nbytes / 2 ** 30)
+
+    # --- tiling
+    def tile_shape(self):
+        # trailing axes whole while they fit, one axis cut to the remaining budget, leading axes 1
+        budget = max(1, self.tile_bytes // self.dtype.itemsize)
+        tile = [1] * self.ndim
+        for k in range(self.ndim - 1, -1, -1):
+            if self.shape[k] <= budget:
+                tile[k] = self.shape[k]
+                budget //= max(1, self.shape[k])
+            else:
+                tile[k] = budget
+                break
+        return tuple(tile)
+
+    def tiles(self):
+        """Yield (index, block): block == full_result[index], one tile-sized block at a time."""
+        tile = self.tile_shape()
+        counts = [-(-n // t) if n else 0 for n, t in zip(self.shape, tile)]
+        for pos in np.ndindex(*counts):
+            index = tuple(slice(p * t, min((p + 1) * t, n)) for p, t, n in zip(pos, tile, self.shape))
+            args = [_slice_operand(op, self.ndim, index) for op in self.operands]
+            block = np.asarray(self.func(*args))
+            shape = tuple(s.stop - s.start for s in index)
+            yield index, np.broadcast_to(block, shape) if block.shape != shape else block
+
+    # --- reductions
+    def reduce(self, ufunc, axis=None, dtype=None):
+        """ufunc.reduce over axis (int, tuple or None) of the broadcast result, tile by tile."""
+        axes = tuple(range(self.ndim)) if axis is None else tuple(
+            a % self.ndim for a in (axis if isinstance(axis, tuple) else (axis,)))
+        out_shape = tuple(1 if k in axes else n for k, n in enumerate(self.shape))
+        acc, seen = None, set()
+        for index, block in self.tiles():
+            part = ufunc.reduce(block, axis=axes, dtype=dtype, keepdims=True)
+            if acc is None:
+                acc = np.empty(out_shape, part.dtype)
+            target = tuple(slice(0, 1) if k in axes else s for k, s in enumerate(index))
+            key = tuple(s.start for k, s in enumerate(index) if k not in axes)
+            if key in seen:
+                ufunc(acc[target], part, out=acc[target])
+            else:
+                acc[target] = part
+                seen.add(key)
+        if acc is None:
+            raise ValueError('zero-size broadcast result has nothing to reduce')
+        result = acc.reshape(tuple(n for k, n in enumerate(out_shape) if k not in axes))
+        return result[()] if result.ndim == 0 else result
+
+    def sum(self, axis=None, dtype=None):
+        return self.reduce(np.add, axis, dtype)
+
+    def prod(self, axis=None, dtype=None):
+        return self.reduce(np.multiply, axis, dtype)
+
+    def min(self, axis=None):
+        return self.reduce(np.minimum, axis)
+
+    def max(self, axis=None):
+        return self.reduce(np.maximum, axis)
+
+    def any(self, axis=None):
+        return self.reduce(np.logical_or, axis)
+
+    def all(self, axis=None):
+        return self.reduce(np.logical_and, axis)
+
+    def mean(self, axis=None):
+        axes = range(self.ndim) if axis is None else (axis if isinstance(axis, tuple) else (axis,))
+        count = int(np.prod([self.shape[a] for a in axes]))
+        return self.sum(axis, dtype=np.result_type(self.dtype, np.float64)) / count
+
+    # --- the full array, only when it fits
+    def materialize(self, limit=None):
+        limit = MAX_BYTES if limit is None else limit
+        if self.nbytes > limit:
+            raise TooLarge('broadcast result %s %s would need %.1f GB (limit %.1f GB); reduce it '
+                           '(.sum(axis=...), .min(), ...) or walk .tiles() instead'
+                           % (self.shape, self.dtype, self.nbytes / 2 ** 30, limit / 2 ** 30))
+        out = np.empty(self.shape, self.dtype)
+        for index, block in self.tiles():
+            out[index] = block
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.materialize()
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+
+def plan(func, *operands, tile_bytes=TILE_BYTES):
+    return BroadcastPlan(func, *operands, tile_bytes=tile_bytes)
+
+
+if __name__ == '__main__':
+    import time
+    import tracemalloc
+
+    x = np.random.RandomState(0).rand(5000)
+    for label, call in [('numpy  (x[:, None] + x).sum(0)', lambda: (x[:, None] + x).sum(0)),
+                        ('plan(np.add, x[:, None], x).sum(0)', lambda: plan(np.add, x[:, None], x).sum(0))]:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        call()
+        t = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('%-36s %8.1f ms %8.1f MB peak' % (label, t * 1e3, peak / 2 ** 20))
+    print(plan(np.add, np.ones((10 ** 5, 1)), np.ones(10 ** 5)))
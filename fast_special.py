@@ -0,0 +1,161 @@
+### Table-driven fast mode for scipy.special gamma / gammaln / erf / erfinv
+# The special functions in 2.3-npUFuncs.py are evaluated exactly per element. For bulk
+# probability transforms (hundreds of millions of erf / erfinv calls) a precomputed table plus
+# linear interpolation is accurate to ~1e-8 and needs no series / continued-fraction work per
+# element: the table index comes from one multiply (uniform grid in x or log x), then two gathers.
+#
+# Each function's table is built on first use, and its worst-case error is *measured* at build
+# time at the midpoint of every table interval (where linear interpolation error peaks) and
+# declared in .max_error. Inputs outside the table's domain fall back to the exact scipy function.
+#
+# scipy's gamma / gammaln are already cheap: the table only beats them when (nearly) all inputs
+# are in its domain (x <= 10), so those two stay exact unless fast=True is asked for.
+#
+# usage:
+#   from fast_special import erf, erfinv, gamma, gammaln
+#   erf(x)                  # approximation (fast=True by default for erf / erfinv)
+#   erf(x, fast=False)      # exact scipy.special.erf
+#   gammaln(x, fast=True)   # table for small x (exact by default)
+#   erf.max_error           # declared bound ('abs' or 'rel', see .error_kind)
+#
+#   python fast_special.py  # accuracy vs. speed table against the exact functions
+import numpy as np
+from scipy import special
+
+from bench_helpers import best_time
+
+
+class TableFunction(object):
+    """Vectorized table-lookup approximation of an exact ufunc on a bounded domain.
+
+    The table is uniform in u = x (space='linear') or u = log(x) (space='log'), so the
+    interval of each input is found by arithmetic instead of a search.
+    """
+
+    def __init__(self, name, exact, lo, hi, size, space='linear', error_kind='abs',
+                 transform=None, clamp=False, fast=True):
+        self.__name__ = name
+        self.exact = exact
+        self.lo, self.hi, self.size, self.space = lo, hi, size, space
+        self.error_kind = error_kind
+        self.transform = transform      # (tabulated function, inverse) e.g. (gammaln, exp) for gamma
+        self.clamp = clamp              # outside the domain, hold the end values (erf -> +-1)
+        self.fast = fast                # default for __call__'s fast=
+        self._fp = None
+        self._max_error = None
+
+    def _u(self, x):
+        return np.log(x) if self.space == 'log' else np.asarray(x, dtype=float)
+
+    def _build(self):
+        u0, u1 = self._u(self.lo), self._u(self.hi)
+        u = np.linspace(u0, u1, self.size)
+        xp = np.exp(u) if self.space == 'log' else u
+        tabulated = self.transform[0] if self.transform else self.exact
+        fp = tabulated(xp)
+        self._u0, self._scale = float(u0), (self.size - 1) / float(u1 - u0)
+        self._fp = fp
+        self._slope = np.append(np.diff(fp), 0.0)
+        # linear interpolation error peaks mid-interval: measure it there, for every interval
+        mid = np.exp(0.5 * (u[1:] + u[:-1])) if self.space == 'log' else 0.5 * (xp[1:] + xp[:-1])
+        err = np.abs(self._table(mid) - self.exact(mid))
+        if self.error_kind == 'rel':
+            err = err / np.abs(self.exact(mid))
+        self._max_error = float(np.max(err))
+
+    def _table(self, x):
+        # u -> fractional table position -> fp[i] + t * (fp[i+1] - fp[i]), reusing one temporary
+        pos = self._u(x) - self._u0
+        pos *= self._scale
+        np.fmax(pos, 0, out=pos)                # fmax / fmin (unlike clip) also map NaN into range;
+        np.fmin(pos, self.size - 1, out=pos)    # callers patch NaN inputs afterwards
+        i = pos.astype(np.intp)
+        pos -= i                                # pos is now t in [0, 1)
+        pos *= self._slope.take(i)
+        pos += self._fp.take(i)
+        return self.transform[1](pos, out=pos) if self.transform else pos
+
+    def _ensure(self):
+        if self._fp is None:
+            self._build()
+
+    @property
+    def max_error(self):
+        self._ensure()
+        return self._max_error
+
+    @property
+    def table_bytes(self):
+        self._ensure()
+        return self._fp.nbytes + self._slope.nbytes
+
+    def __call__(self, x, fast=None):
+        if not (self.fast if fast is None else fast):
+            return self.exact(x)
+        self._ensure()
+        x = np.asarray(x, dtype=float)
+        scalar = x.ndim == 0
+        x = np.atleast_1d(x)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            y = self._table(x)
+        if not self.clamp:
+            outside = ~((x >= self.lo) & (x <= self.hi))    # also NaN and +-inf
+            if outside.any():
+                y[outside] = self.exact(x[outside])
+        else:
+            nan = np.isnan(x)
+            if nan.any():
+                y[nan] = np.nan
+        return y[0] if scalar else y
+
+    def __repr__(self):
+        if self._max_error is None:
+            return '<fast %s, table not built>' % self.__name__
+        return '<fast %s, %s error <= %.2g>' % (self.__name__, self.error_kind, self._max_error)
+
+
+##############################
+### The tables
+# erf: uniform grid on [-6, 6]; |erf(x)| differs from 1 by < 3e-17 beyond, so clamping is exact.
+erf = TableFunction('erf', special.erf, -6.0, 6.0, 2 ** 17 + 1, clamp=True)
+
+# erfinv: blows up at +-1, so tabulate |y| <= 0.995 only; the tails go to scipy.
+erfinv = TableFunction('erfinv', special.erfinv, -0.995, 0.995, 2 ** 18 + 1)
+
+# gammaln: trigamma ~ 1/x**2 near 0, so a table uniform in log(x) keeps the interpolation error
+# flat down to x = 1e-3. Past x = 10 scipy is faster than any series here (see benchmark), and
+# even on the table's domain the gain is small, so gammaln / gamma default to exact.
+gammaln = TableFunction('gammaln', special.gammaln, 1e-3, 10.0, 2 ** 18 + 1, space='log', fast=False)
+
+# gamma: exp of the gammaln table -> relative error ~ gammaln's absolute error.
+gamma = TableFunction('gamma', special.gamma, 1e-3, 10.0, 2 ** 18 + 1, space='log', error_kind='rel',
+                      transform=(special.gammaln, np.exp), fast=False)
+
+
+##############################
+### Accuracy vs. speed
+def benchmark(n=10 ** 6, repeat=3):
+    rng = np.random.RandomState(0)
+    cases = [(erf, 'normal(0, 2)', rng.normal(0, 2, n)),
+             (erfinv, '(-0.999, 0.999)', rng.uniform(-0.999, 0.999, n)),
+             (gammaln, '(0.01, 10)', rng.uniform(0.01, 10, n)),
+             (gammaln, '(0.01, 100)', rng.uniform(0.01, 100, n)),
+             (gamma, '(0.01, 10)', rng.uniform(0.01, 10, n)),
+             (gamma, '(0.01, 50)', rng.uniform(0.01, 50, n))]
+    print('%-8s %-16s %10s %10s %8s %12s %12s' % (
+        'func', 'x', 'exact ms', 'fast ms', 'speedup', 'declared', 'observed'))
+    for f, label, x in cases:
+        f.max_error     # build outside the timing
+
+        t_exact = best_time(lambda: f.exact(x), repeat)
+        t_fast = best_time(lambda: f(x, fast=True), repeat)
+        exact, fast = f.exact(x), f(x, fast=True)
+        err = np.abs(fast - exact)
+        if f.error_kind == 'rel':
+            err = err / np.abs(exact)
+        print('%-8s %-16s %10.2f %10.2f %8.2f %12.2g %12.2g' % (
+            f.__name__, label, t_exact * 1e3, t_fast * 1e3, t_exact / t_fast, f.max_error, err.max()))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,219 @@
+### Grid evaluation with separable terms computed once
+# z = np.sin(x) ** 10 + np.cos(10 + y * x) * np.cos(x) (2.5-broadcasting.py), and f(X, Y) on a
+# full np.meshgrid in 4.04-densityContour3D.py, evaluate sin(x) ** 10 and cos(x) once per grid
+# *point*, although they only change along x. grid() traces f with stand-ins for x and y: every
+# sub-expression that depends on one axis only is computed right away, once, on the 1-D axis;
+# only the terms that mix x and y are recorded, and those are filled in row tile by row tile on
+# a thread pool (ufunc loops release the GIL), writing straight into the output.
+# f may use numpy ufuncs, arithmetic operators and comparisons; anything else (np.where,
+# x.max(), y.mean(), ...) falls back to evaluating f once on the whole open grid, since a
+# reduction inside f has to see every row. With elementwise=True the caller promises that
+# f(x, y) at a point only depends on that point, and the fallback runs on row tiles instead.
+#
+# progressive() doubles the resolution level by level, for interactive plots: each finer grid
+# keeps the previous level's points (every other row / column) and only computes the new ones.
+#
+# usage:
+#   f = lambda x, y: np.sin(x) ** 10 + np.cos(10 + y * x) * np.cos(x)
+#   z = grid(f, np.linspace(0, 5, 2000), np.linspace(0, 5, 2000))    # == f(*np.meshgrid(x, y))
+#   for x, y, z in progressive(f, (0, 5), (0, 5), start=(26, 26), levels=5):
+#       plt.contour(x, y, z)
+#
+#   python grid_eval.py                  # vs. f(*np.meshgrid(x, y))
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bench_helpers import best_time
+
+TILE_BYTES = 2 * 2 ** 20     # output rows per tile: about this many bytes
+
+
+class _Untraceable(Exception):
+    pass
+
+
+class Term(object):
+    """Stand-in for a value of f during tracing.
+
+    axes is the set of grid axes ('x', 'y') the value depends on. One-axis (or constant) terms
+    are computed eagerly and kept in value, shaped (1, nx) or (ny, 1); terms over both axes keep
+    ufunc / args and are evaluated later, per row tile.
+    """
+
+    __array_priority__ = 100
+
+    def __init__(self, axes, value=None, ufunc=None, args=()):
+        self.axes = axes
+        self.value = value
+        self.ufunc = ufunc
+        self.args = args
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or kwargs or ufunc.nout != 1:
+            raise _Untraceable('%s.%s' % (ufunc.__name__, method))
+        return _apply(ufunc, inputs)
+
+    def _bin(ufunc, reflected=False):
+        if reflected:
+            return lambda self, other: _apply(ufunc, (other, self))
+        return lambda self, other: _apply(ufunc, (self, other))
+
+    __add__, __radd__ = _bin(np.add), _bin(np.add, True)
+    __sub__, __rsub__ = _bin(np.subtract), _bin(np.subtract, True)
+    __mul__, __rmul__ = _bin(np.multiply), _bin(np.multiply, True)
+    __truediv__, __rtruediv__ = _bin(np.true_divide), _bin(np.true_divide, True)
+    __pow__, __rpow__ = _bin(np.power), _bin(np.power, True)
+    __mod__, __rmod__ = _bin(np.remainder), _bin(np.remainder, True)
+    __lt__, __le__ = _bin(np.less), _bin(np.less_equal)
+    __gt__, __ge__ = _bin(np.greater), _bin(np.greater_equal)
+    __eq__, __ne__ = _bin(np.equal), _bin(np.not_equal)
+    __hash__ = object.__hash__
+    del _bin
+
+    def __neg__(self):
+        return _apply(np.negative, (self,))
+
+    def __abs__(self):
+        return _apply(np.absolute, (self,))
+
+    def __bool__(self):
+        raise _Untraceable('truth value of a grid term')
+
+    def __getattr__(self, name):
+        # ndarray methods (.clip, .sum, .T, ...) can't be traced: fall back to tiled evaluation
+        if name.startswith('__'):
+            raise AttributeError(name)
+        raise _Untraceable('attribute .%s of a grid term' % name)
+
+    def __repr__(self):
+        if self.value is not None:
+            return 'Term(%s, %s)' % (''.join(sorted(self.axes)) or 'const', self.value.shape)
+        return '%s(%s)' % (self.ufunc.__name__, ', '.join(map(repr, self.args)))
+
+
+def _apply(ufunc, inputs):
+    axes = set()
+    for a in inputs:
+        if isinstance(a, Term):
+            axes |= a.axes
+        elif np.ndim(a) > 0 and np.size(a) > 1:
+            raise _Untraceable('array constant of shape %s' % (np.shape(a),))
+    if len(axes) <= 1:
+        # separable: compute now, on the 1-D axis only
+        return Term(axes, value=ufunc(*[a.value if isinstance(a, Term) else a for a in inputs]))
+    return Term(axes, ufunc=ufunc, args=inputs)
+
+
+def trace(f, x, y):
+    """Run f on stand-ins for the grid axes; returns the root Term (or raises _Untraceable)."""
+    tx = Term({'x'}, value=np.asarray(x, dtype=float).reshape(1, -1))
+    ty = Term({'y'}, value=np.asarray(y, dtype=float).reshape(-1, 1))
+    root = f(tx, ty)
+    if not isinstance(root, Term):
+        raise _Untraceable('f returned %s' % type(root).__name__)
+    return root
+
+
+def _evaluate(term, r0, r1, memo):
+    # value of term on grid rows r0:r1 (shared sub-terms evaluated once per tile)
+    if not isinstance(term, Term):
+        return term
+    if term.value is not None:
+        v = term.value
+        return v[r0:r1] if v.shape[0] > 1 else v
+    key = id(term)
+    if key not in memo:
+        memo[key] = term.ufunc(*[_evaluate(a, r0, r1, memo) for a in term.args])
+    return memo[key]
+
+
+def _rows_per_tile(nx, itemsize=8):
+    return max(1, TILE_BYTES // max(1, nx * itemsize))
+
+
+def grid(f, x, y, out=None, workers=None, rows=None, elementwise=False):
+    """z[i, j] = f(x[j], y[i]) -- the same layout as f(*np.meshgrid(x, y)).
+
+    elementwise=True lets an untraceable f be evaluated tile by tile (f must not reduce over x or y).
+    """
+    x, y = np.asarray(x, dtype=float).reshape(-1), np.asarray(y, dtype=float).reshape(-1)
+    ny, nx = len(y), len(x)
+    full = None
+    try:
+        root = trace(f, x, y)
+        tile_func = lambda r0, r1: _evaluate(root, r0, r1, {})
+    except (_Untraceable, AttributeError, TypeError):
+        # not expressible with ufuncs / operators on Terms (e.g. np.where, len(x), x.max())
+        root = None
+        tile_func = lambda r0, r1: f(x[None, :], y[r0:r1, None])
+        if not elementwise:
+            full = np.asarray(f(x[None, :], y[:, None]))
+    if out is None:
+        probe = full if full is not None else np.asarray(tile_func(0, min(1, ny)))
+        out = np.empty((ny, nx), probe.dtype)
+    elif out.shape != (ny, nx):
+        raise ValueError('out has shape %s, expected %s' % (out.shape, (ny, nx)))
+    if full is not None:
+        out[...] = full
+        return out
+    if root is not None and root.value is not None:
+        out[...] = root.value      # f depends on one axis only
+        return out
+    rows = rows or _rows_per_tile(nx, out.itemsize)
+
+    def task(r0):
+        r1 = min(r0 + rows, ny)
+        out[r0:r1] = tile_func(r0, r1)
+
+    starts = range(0, ny, rows)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(starts) == 1:
+        for r0 in starts:
+            task(r0)
+    else:
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(task, starts))
+    return out
+
+
+def progressive(f, xlim, ylim, start=(26, 26), levels=4, workers=None, elementwise=False):
+    """Yield (x, y, z) on grids of (n - 1) * 2**level + 1 points per axis, coarse to fine.
+
+    Each level reuses the previous z for every other row and column, so only new points are computed.
+    """
+    nx, ny = start
+    z = None
+    for level in range(levels):
+        x = np.linspace(xlim[0], xlim[1], nx)
+        y = np.linspace(ylim[0], ylim[1], ny)
+        if z is None:
+            z = grid(f, x, y, workers=workers, elementwise=elementwise)
+        else:
+            fine = np.empty((ny, nx), z.dtype)
+            fine[::2, ::2] = z
+            fine[1::2] = grid(f, x, y[1::2], workers=workers, elementwise=elementwise)            # new rows
+            fine[::2, 1::2] = grid(f, x[1::2], y[::2], workers=workers, elementwise=elementwise)  # new columns
+            z = fine
+        yield x, y, z
+        nx, ny = 2 * nx - 1, 2 * ny - 1
+
+
+##############################
+### Benchmark
+def benchmark(sizes=(500, 2000, 5000), repeat=3):
+    f = lambda x, y: np.sin(x) ** 10 + np.cos(10 + y * x) * np.cos(x)
+
+    print('%8s %14s %14s %10s %8s' % ('n x n', 'meshgrid ms', 'open grid ms', 'grid ms', 'speedup'))
+    for n in sizes:
+        x = y = np.linspace(0, 5, n)
+        assert np.allclose(grid(f, x, y), f(*np.meshgrid(x, y)))
+        t_mesh = best_time(lambda: f(*np.meshgrid(x, y)), repeat)
+        t_open = best_time(lambda: f(x[None, :], y[:, None]), repeat)
+        t_grid = best_time(lambda: grid(f, x, y), repeat)
+        print('%8d %14.1f %14.1f %10.1f %8.2f' % (n, t_mesh * 1e3, t_open * 1e3, t_grid * 1e3, t_mesh / t_grid))
+
+
+if __name__ == '__main__':
+    benchmark()
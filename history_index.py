@@ -0,0 +1,198 @@
+### Indexed command history (a better Ctrl-r)
+# 1.2-terminal.py: Ctrl-r reverse search gets unreliable once you cycle back far enough.
+# This keeps every input in a SQLite file with an FTS5 trigram index, so substring and fuzzy
+# lookups over hundreds of thousands of inputs take milliseconds, and paging to older matches
+# continues from the last row seen (rowid < last) instead of scanning again from the newest.
+#
+# usage:
+#   h = HistoryIndex('history_index.sqlite')
+#   h.import_ipython()                  # pull in ~/.ipython/profile_default/history.sqlite
+#   h.search('squa')                    # newest 20 inputs containing 'squa'
+#   for row in h.iter_search('squa'):   # ... and all the way back to the oldest one
+#       print(row.source)
+#   h.fuzzy('sum_of_lsts')              # typo-tolerant, best matches first
+#
+#   python history_index.py squa        # quick command-line search
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+Entry = namedtuple('Entry', 'id session line source')
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.ipython', 'history_index.sqlite')
+IPYTHON_HISTORY = os.path.join(os.path.expanduser('~'), '.ipython', 'profile_default', 'history.sqlite')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inputs (
+    id      INTEGER PRIMARY KEY,
+    session INTEGER,
+    line    INTEGER,
+    source  TEXT NOT NULL,
+    added   REAL,
+    UNIQUE (session, line)
+);
+"""
+
+# external-content FTS table kept in sync with triggers, so the text is only stored once
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS inputs_fts USING fts5(
+    source, content='inputs', content_rowid='id', tokenize='trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS inputs_vocab USING fts5vocab(inputs_fts, 'row');
+CREATE TRIGGER IF NOT EXISTS inputs_ai AFTER INSERT ON inputs BEGIN
+    INSERT INTO inputs_fts(rowid, source) VALUES (new.id, new.source);
+END;
+CREATE TRIGGER IF NOT EXISTS inputs_ad AFTER DELETE ON inputs BEGIN
+    INSERT INTO inputs_fts(inputs_fts, rowid, source) VALUES ('delete', old.id, old.source);
+END;
+"""
+
+
+def _quote(text):
+    # FTS5 string literal: the trigram tokenizer turns a quoted phrase into a substring match
+    return '"%s"' % text.replace('"', '""')
+
+
+def _trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class HistoryIndex(object):
+    """SQLite-backed input history with substring, fuzzy and paged reverse search."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+        try:
+            self.db.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite < 3.34 has no trigram tokenizer: still works, but by scanning with instr()
+            self.fts = False
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT count(*) FROM inputs').fetchone()[0]
+
+    ##############################
+    ### Adding
+    def add(self, source, session=None, line=None):
+        with self.db:
+            self.db.execute('INSERT OR IGNORE INTO inputs (session, line, source, added) VALUES (?, ?, ?, ?)',
+                            (session, line, source, time.time()))
+
+    def add_many(self, rows):
+        """rows: iterable of (session, line, source)."""
+        now = time.time()
+        with self.db:
+            self.db.executemany('INSERT OR IGNORE INTO inputs (session, line, source, added) VALUES (?, ?, ?, ?)',
+                                ((s, l, src, now) for s, l, src in rows))
+
+    def import_ipython(self, path=IPYTHON_HISTORY):
+        """Copy inputs from an iPython history.sqlite; rows already imported are skipped."""
+        src = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+        try:
+            before = len(self)
+            self.add_many(src.execute('SELECT session, line, source FROM history ORDER BY session, line'))
+            return len(self) - before
+        finally:
+            src.close()
+
+    ##############################
+    ### Searching
+    def search(self, text, before=None, limit=20):
+        """Newest inputs containing text (case-insensitive), older than id before."""
+        before = before if before is not None else sys.maxsize
+        if self.fts and len(text) >= 3:
+            rows = self.db.execute(
+                'SELECT i.id, i.session, i.line, i.source FROM inputs_fts f JOIN inputs i ON i.id = f.rowid '
+                'WHERE inputs_fts MATCH ? AND f.rowid < ? ORDER BY f.rowid DESC LIMIT ?',
+                (_quote(text), before, limit))
+        else:
+            # too short for a trigram (or no FTS5): walk ids downwards, still starting at 'before'
+            rows = self.db.execute(
+                'SELECT id, session, line, source FROM inputs '
+                'WHERE id < ? AND instr(lower(source), lower(?)) > 0 ORDER BY id DESC LIMIT ?',
+                (before, text, limit))
+        return [Entry(*r) for r in rows]
+
+    def iter_search(self, text, page=200, unique=False):
+        """Yield every match newest to oldest, one page at a time (keyset paging on id)."""
+        seen = set()
+        before = None
+        while True:
+            rows = self.search(text, before, page)
+            for row in rows:
+                if unique:
+                    if row.source in seen:
+                        continue
+                    seen.add(row.source)
+                yield row
+            if len(rows) < page:
+                return
+            before = rows[-1].id
+
+    def fuzzy(self, text, limit=20, candidates=500, min_share=0.5):
+        """Best matches for text allowing typos: ranked by shared trigrams, then recency.
+
+        Rows sharing at least min_share of the query's trigrams are looked for among the newest
+        `candidates` rows holding each of its rarest trigrams. So such a row is missed when, for
+        every looked-up trigram it contains, `candidates` newer rows contain that trigram too:
+        old matches made of common trigrams are not guaranteed to be found.
+        """
+        grams = _trigrams(text)
+        if not grams or not self.fts:
+            return self.search(text, limit=limit)
+        # A row sharing >= need of the query's trigrams contains at least one of any P - need + 1
+        # of the P trigrams present in the index, so only the rarest P - need + 1 are looked up.
+        # Each is queried on its own, newest first with a LIMIT (no rank), so FTS5 stops early and
+        # a common trigram can't crowd out the few rows holding a rare one. Strict thresholds
+        # need only the rarest trigrams and run first; looser ones only if still short of limit.
+        found = dict(self.db.execute(
+            'SELECT term, doc FROM inputs_vocab WHERE term IN (%s)' % ','.join('?' * len(grams)),
+            sorted(grams)).fetchall())
+        present = sorted((g for g in grams if g in found), key=found.get)
+        scored, looked_up = {}, 0
+        for share in (1.0, 0.75, min_share):
+            need = max(1, int(-(-len(grams) * share // 1)))
+            if need > len(present):
+                continue
+            for g in present[looked_up:len(present) - need + 1]:
+                for row in self.db.execute(
+                        'SELECT i.id, i.session, i.line, i.source FROM inputs_fts f JOIN inputs i '
+                        'ON i.id = f.rowid WHERE inputs_fts MATCH ? ORDER BY f.rowid DESC LIMIT ?',
+                        (_quote(g), candidates)):
+                    if row[0] not in scored:
+                        scored[row[0]] = (len(grams & _trigrams(row[3])), Entry(*row))
+            looked_up = max(looked_up, len(present) - need + 1)
+            if sum(1 for shared, e in scored.values() if shared >= need) >= limit:
+                break
+        best = sorted(scored.items(), key=lambda kv: (-kv[1][0], -kv[0]))
+        return [entry for rowid, (shared, entry) in best[:limit]]
+
+    def oldest(self, text):
+        """Oldest input containing text, in one indexed query."""
+        if self.fts and len(text) >= 3:
+            row = self.db.execute(
+                'SELECT i.id, i.session, i.line, i.source FROM inputs_fts f JOIN inputs i ON i.id = f.rowid '
+                'WHERE inputs_fts MATCH ? ORDER BY f.rowid ASC LIMIT 1', (_quote(text),)).fetchone()
+        else:
+            row = self.db.execute(
+                'SELECT id, session, line, source FROM inputs WHERE instr(lower(source), lower(?)) > 0 '
+                'ORDER BY id ASC LIMIT 1', (text,)).fetchone()
+        return Entry(*row) if row else None
+
+
+if __name__ == '__main__':
+    index = HistoryIndex()
+    if os.path.exists(IPYTHON_HISTORY):
+        index.import_ipython()
+    for entry in index.search(' '.join(sys.argv[1:])):
+        print('%5s/%-5s %s' % (entry.session, entry.line, entry.source.splitlines()[0] if entry.source else ''))
@@ -0,0 +1,126 @@
+### Lazy imports for the heavy packages
+# Most chapter scripts import matplotlib.pyplot / seaborn / scipy / sklearn / pandas up front,
+# and those imports are most of the run time for short scripts. Modules imported lazily are
+# only created when an attribute is first used, so an unused import costs ~nothing.
+#
+# usage:
+#   from lazy_imports import lazy_import
+#   seaborn = lazy_import('seaborn')    # nothing loaded yet
+#   seaborn.set()                       # loads here
+#
+#   # or make plain 'import seaborn' statements lazy for the rest of the process:
+#   import lazy_imports; lazy_imports.enable()
+#
+#   # where does the import time go?
+#   python lazy_imports.py pandas seaborn
+#   python lazy_imports.py --lazy pandas seaborn
+import importlib
+import importlib.abc
+import importlib.util
+import re
+import subprocess
+import sys
+
+# Only these exact module names are made lazy. Their own submodules still import eagerly once
+# the package is touched: packages like pandas do 'from .x import y' internally, which breaks
+# if the inner modules are lazy too.
+HEAVY = ('matplotlib', 'matplotlib.pyplot', 'seaborn', 'scipy', 'sklearn', 'pandas')
+
+
+def lazy_import(name):
+    """Import module name without executing it until the first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    if '.' in name:
+        # the parent has to be real for its __path__ to be searched; import it lazily too
+        lazy_import(name.rpartition('.')[0])
+    parent = sys.modules.get(name.rpartition('.')[0])
+    spec = LazyFinder([name]).find_spec(name, getattr(parent, '__path__', None))
+    if spec is None:
+        raise ModuleNotFoundError('No module named %r' % name, name=name)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class LazyFinder(importlib.abc.MetaPathFinder):
+    """Meta path finder that hands out lazy modules for the given module names."""
+
+    def __init__(self, packages=HEAVY):
+        self.packages = tuple(packages)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname not in self.packages:
+            return None
+        others = [f for f in sys.meta_path if f is not self and not isinstance(f, LazyFinder)]
+        for finder in others:
+            find_spec = getattr(finder, 'find_spec', None)
+            spec = find_spec(fullname, path) if find_spec else None
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = importlib.util.LazyLoader(spec.loader)
+        return spec
+
+
+def enable(packages=HEAVY):
+    """Make 'import pkg' lazy for each module name in packages. Returns the finder."""
+    finder = LazyFinder(packages)
+    sys.meta_path.insert(0, finder)
+    return finder
+
+
+def disable(finder=None):
+    for f in list(sys.meta_path):
+        if isinstance(f, LazyFinder) and (finder is None or f is finder):
+            sys.meta_path.remove(f)
+
+
+##############################
+### Import-time report
+def import_times(statement, lazy=False, python=sys.executable):
+    """Run statement in a fresh interpreter under -X importtime.
+
+    Returns [(module, self seconds, cumulative seconds, depth)] in import order.
+    """
+    if lazy:
+        statement = 'import lazy_imports; lazy_imports.enable(); ' + statement
+    proc = subprocess.run([python, '-X', 'importtime', '-c', statement],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = re.match(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)', line)
+        if m:
+            depth = (len(m.group(3)) - 1) // 2
+            rows.append((m.group(4), int(m.group(1)) / 1e6, int(m.group(2)) / 1e6, depth))
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return rows
+
+
+def report(modules, lazy=False, top=15, stream=sys.stdout):
+    """Print total and per-package cumulative import cost of importing modules."""
+    statement = '; '.join('import %s' % m for m in modules)
+    rows = import_times(statement, lazy)
+    top_level = [r for r in rows if r[3] == 0]
+    total = sum(r[2] for r in top_level)
+    stream.write('%s%s: %.3f s\n' % (statement, ' (lazy)' if lazy else '', total))
+    # cumulative time per top-level package, summed over all its submodules imported at depth 0
+    per_package = {}
+    for name, self_t, cumulative, depth in top_level:
+        key = name.split('.')[0]
+        per_package[key] = per_package.get(key, 0.0) + cumulative
+    for name, t in sorted(per_package.items(), key=lambda kv: -kv[1])[:top]:
+        stream.write('  %-30s %8.3f s  %5.1f%%\n' % (name, t, 100 * t / total if total else 0))
+    return total, per_package
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    lazy = '--lazy' in args
+    modules = [a for a in args if a != '--lazy'] or list(HEAVY)
+    report(modules, lazy=lazy)
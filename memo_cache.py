@@ -0,0 +1,214 @@
+### Content-addressed result cache
+# Out[n] reuse (1.4-IOhistory.py) only lasts one session. This caches results on disk, keyed by
+# a hash of the function's source + its arguments, so re-running a script like
+# 3.12-numexprQueryEval.py skips steps whose code and inputs haven't changed.
+# Big arrays are hashed straight from their buffers in chunks (no copy, no pickling).
+#
+# usage:
+#   @memoize
+#   def make_frames(nrows, ncols, seed): ...
+#
+#   @memoize(max_bytes=5 * 1024 ** 3, max_age=7 * 86400)
+#   def slow_step(df, threshold): ...
+#
+#   # cache a code block: re-runs only if the code or the listed inputs change
+#   ns = run_cached('mask = (x > 0.5) & (y < 0.5)', inputs={'x': x, 'y': y}, outputs=['mask'])
+import functools
+import hashlib
+import importlib
+import inspect
+import os
+import pickle
+import time
+import types
+
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pdsh_memo')
+HASH_CHUNK = 1 << 24    # 16 MB of array buffer per hash update
+
+
+##############################
+### Fingerprints
+def _update(h, obj):
+    # feed obj into hash h. Tags keep e.g. the int 1 and the str '1' apart.
+    if isinstance(obj, np.ndarray):
+        h.update(b'nd' + str((obj.dtype.str, obj.shape)).encode())
+        if obj.dtype == object:
+            h.update(pickle.dumps(obj.tolist(), protocol=4))
+            return
+        flat = np.ascontiguousarray(obj).reshape(-1).view(np.uint8)
+        for start in range(0, flat.size, HASH_CHUNK):
+            h.update(memoryview(flat[start:start + HASH_CHUNK]))
+    elif hasattr(obj, 'to_numpy') and hasattr(obj, 'index'):    # pandas Series / DataFrame
+        h.update(b'pd' + type(obj).__name__.encode())
+        _update(h, list(obj.columns) if hasattr(obj, 'columns') else getattr(obj, 'name', None))
+        _update(h, np.asarray(obj.index))
+        if hasattr(obj, 'columns'):
+            for col in obj.columns:
+                _update(h, obj[col].to_numpy())
+        else:
+            _update(h, obj.to_numpy())
+    elif isinstance(obj, (list, tuple)):
+        h.update(type(obj).__name__.encode() + str(len(obj)).encode())
+        for item in obj:
+            _update(h, item)
+    elif isinstance(obj, dict):
+        h.update(b'dict' + str(len(obj)).encode())
+        for key in sorted(obj, key=repr):
+            _update(h, key)
+            _update(h, obj[key])
+    elif isinstance(obj, (set, frozenset)):
+        # iteration order depends on PYTHONHASHSEED: hash each element alone, then the sorted digests
+        h.update(type(obj).__name__.encode() + str(len(obj)).encode())
+        for digest in sorted(fingerprint(item) for item in obj):
+            h.update(digest.encode())
+    else:
+        h.update(b'py' + pickle.dumps(obj, protocol=4))
+
+
+def fingerprint(*objs):
+    """Hex digest identifying the contents of objs."""
+    h = hashlib.blake2b(digest_size=20)
+    for obj in objs:
+        _update(h, obj)
+    return h.hexdigest()
+
+
+def _source_of(func):
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        # defined interactively / in exec'd code: fall back to the bytecode + constants
+        code = func.__code__
+        return repr((code.co_code, code.co_consts, code.co_names))
+
+
+##############################
+### On-disk store
+class Cache(object):
+    """Directory of pickled results named by key, evicted by total size and age."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=2 * 1024 ** 3, max_age=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.max_age is not None and time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return False, None
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # ... including results whose class / module has since been renamed or removed
+            return False, None
+        os.utime(path)      # mtime doubles as last-access time for LRU eviction
+        return True, value
+
+    def put(self, key, value):
+        """Store value under key; returns False (nothing stored) if value can't be pickled."""
+        path = self._path(key)
+        tmp = path + '.tmp%d' % os.getpid()
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            os.remove(tmp)
+            return False
+        os.replace(tmp, path)   # atomic, so a crash never leaves a half-written entry
+        self.evict()
+        return True
+
+    def entries(self):
+        out = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                out.append((st.st_mtime, st.st_size, path))
+        return sorted(out)
+
+    def evict(self):
+        now = time.time()
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:     # oldest first
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if not expired and total <= self.max_bytes:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for mtime, size, path in self.entries():
+            os.remove(path)
+
+
+##############################
+### Decorator + code blocks
+def memoize(func=None, cache_dir=CACHE_DIR, max_bytes=2 * 1024 ** 3, max_age=None):
+    """Cache func's results on disk by hash(source, args, kwargs). Use bare or with options."""
+    if func is None:
+        return functools.partial(memoize, cache_dir=cache_dir, max_bytes=max_bytes, max_age=max_age)
+    cache = Cache(cache_dir, max_bytes, max_age)
+    source = _source_of(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = fingerprint(func.__module__, func.__qualname__, source, args, kwargs)
+        hit, value = cache.get(key)
+        if hit:
+            return value
+        value = func(*args, **kwargs)
+        cache.put(key, value)
+        return value
+
+    wrapper.cache = cache
+    return wrapper
+
+
+def _cacheable(value):
+    # modules, functions and classes bound by a block (imports, defs) aren't data to cache
+    return not isinstance(value, (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type))
+
+
+def run_cached(code, inputs=None, outputs=None, namespace=None, cache=None):
+    """exec code with inputs and return the namespace, restoring outputs from cache when possible.
+
+    outputs lists the names to cache (default: every new data name the block binds; modules it
+    imports are re-imported on a cache hit, its functions and classes are not restored).
+    """
+    cache = cache or Cache()
+    inputs = inputs or {}
+    namespace = {} if namespace is None else namespace
+    key = fingerprint('block', code, inputs, outputs)
+    hit, value = cache.get(key)
+    if hit:
+        result, modules = value
+        namespace.update((k, importlib.import_module(m)) for k, m in modules.items())
+        namespace.update(result)
+        return namespace
+    scope = dict(namespace)
+    scope.update(inputs)
+    exec(code, scope)
+    new = [k for k in scope if k not in inputs and k not in namespace and not k.startswith('__')]
+    names = outputs if outputs is not None else [k for k in new if _cacheable(scope[k])]
+    result = {k: scope[k] for k in names}
+    modules = {k: scope[k].__name__ for k in new if isinstance(scope[k], types.ModuleType)}
+    cache.put(key, (result, modules))
+    namespace.update((k, scope[k]) for k in new)
+    namespace.update(result)
+    return namespace
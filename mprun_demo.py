@@ -6,3 +6,72 @@ def sum_of_lists(N):
         del L # remove reference to L
     return total
     
+
+
+# NumPy version of the above. Works through range(N) in fixed-size chunks, so peak
+# memory is a few chunk-sized int64 arrays no matter how big N gets.
+# Each chunk sum is taken in int64 (chunk * 2N stays far below 2**63) and then added to a
+# Python int, so the running total can't overflow even when 5 * N**2 passes int64's range.
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bench_helpers import worker_counts as all_counts
+
+CHUNK = 1 << 20
+
+def _partial_sum(start, stop, shifts, chunk=CHUNK):
+    # sum of j ^ (j >> i) over j in [start, stop) for each i in shifts
+    total = 0
+    buf = np.empty(min(chunk, max(stop - start, 0)), dtype=np.int64)
+    for lo in range(start, stop, chunk):
+        j = np.arange(lo, min(lo + chunk, stop), dtype=np.int64)
+        out = buf[:len(j)]
+        for i in shifts:
+            np.right_shift(j, i, out=out)
+            np.bitwise_xor(j, out, out=out)
+            total += int(out.sum())
+    return total
+
+def sum_of_lists_np(N, chunk=CHUNK, workers=None):
+    # workers=None/1 runs in-process. Otherwise the (shift, range-chunk) grid is split into
+    # tasks over a process pool and the partial sums (Python ints) are added up at the end.
+    if not workers or workers == 1:
+        return _partial_sum(0, N, range(5), chunk)
+    # aim for a few tasks per worker so uneven tasks even out; each task covers one shift
+    # and a contiguous slice of range(N) that is a multiple of chunk
+    n_chunks = -(-N // chunk)
+    per_task = max(1, -(-n_chunks * 5 // (workers * 4)))
+    tasks = [(lo, min(lo + per_task * chunk, N), (i,))
+             for i in range(5)
+             for lo in range(0, N, per_task * chunk)]
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_partial_sum, lo, hi, shifts, chunk) for lo, hi, shifts in tasks]
+        return sum(f.result() for f in futures)
+
+def check_sum_of_lists(N, chunk=CHUNK, workers=None):
+    # the list version stays as the reference implementation
+    expected = sum_of_lists(N)
+    result = sum_of_lists_np(N, chunk, workers)
+    assert result == expected, (N, result, expected)
+    return result
+
+def scaling_report(N, worker_counts=None, chunk=CHUNK):
+    # wall time + speedup vs the single-process run, for each worker count
+    # (pool startup is included, which is what a caller actually pays)
+    rows = []
+    base = None
+    for w in worker_counts or all_counts():
+        t0 = time.perf_counter()
+        sum_of_lists_np(N, chunk, workers=w)
+        elapsed = time.perf_counter() - t0
+        base = base or elapsed
+        rows.append((w, elapsed, base / elapsed))
+    print('%8s %10s %8s %10s' % ('workers', 'seconds', 'speedup', 'efficiency'))
+    for w, elapsed, speedup in rows:
+        print('%8d %10.3f %8.2f %9.0f%%' % (w, elapsed, speedup, 100 * speedup / w))
+    return rows
+
+if __name__ == '__main__':
+    scaling_report(10 ** 8)
@@ -0,0 +1,134 @@
+### Several quantiles from one partition
+# 2.4-aggregations.py asks for np.percentile(heights, 25), np.median(heights) and
+# np.percentile(heights, 75) one call at a time, and 3.09-pivotTables.py gets the births
+# quartiles for sigma-clipping the same way: each call partitions (a copy of) the whole array
+# again. quantiles() works out every order statistic the requested quantiles need and gets them
+# all from a single np.partition with a list of pivots (or a single sort when there are many),
+# then interpolates exactly as np.percentile's default 'linear' method does.
+#
+# usage:
+#   q25, q50, q75 = quantiles(heights, [0.25, 0.5, 0.75])       # == np.quantile(heights, [...])
+#   quantiles(A, [0.1, 0.9], axis=0)                             # per column
+#   keys, table = group_quantiles(values, labels, [0.25, 0.75])  # one row per group
+#
+#   python multi_quantile.py                 # vs. the one-call-per-quantile pattern
+import numpy as np
+
+from bench_helpers import best_time
+
+SORT_ABOVE = 64     # more distinct pivots than this: one sort beats the multi-pivot select
+
+
+def _lerp(a, b, t):
+    # same formula (and rounding) as numpy's 'linear' percentile interpolation
+    diff = b - a
+    result = np.add(a, diff * t)
+    return np.subtract(b, diff * (1 - t), out=result, where=t >= 0.5)
+
+
+def _positions(q, n):
+    # order statistics needed for each q, and the interpolation weight between them
+    virtual = q * (n - 1)
+    lo = np.floor(virtual).astype(np.intp)
+    hi = np.minimum(lo + 1, n - 1)
+    return lo, hi, virtual - lo
+
+
+def quantiles(x, q, axis=None, overwrite_input=False):
+    """np.quantile(x, q, axis=axis) with all of q selected in one partition (or one sort)."""
+    q = np.asarray(q, dtype=float)
+    if np.any((q < 0) | (q > 1)):
+        raise ValueError('quantiles must be in [0, 1]')
+    x = np.asarray(x)
+    if axis is None:
+        x, axis = x.reshape(-1), 0
+    x = np.moveaxis(x, axis, -1)
+    n = x.shape[-1]
+    if n == 0:
+        raise ValueError('cannot take quantiles of an empty axis')
+    lo, hi, t = _positions(q.reshape(-1), n)
+    # n - 1 is always a pivot: NaN sorts last, so the max position tells us about NaNs for free
+    kth = np.unique(np.concatenate([lo, hi, [n - 1]]))
+    if overwrite_input and x.flags.writeable:
+        part = x
+        if len(kth) > SORT_ABOVE:
+            part.sort(axis=-1)
+        else:
+            part.partition(kth, axis=-1)
+    elif len(kth) > SORT_ABOVE:
+        part = np.sort(x, axis=-1)
+    else:
+        part = np.partition(x, kth, axis=-1)
+    a = np.moveaxis(part[..., lo], -1, 0)
+    b = np.moveaxis(part[..., hi], -1, 0)
+    t = t.reshape((-1,) + (1,) * (a.ndim - 1))
+    result = _lerp(a, b, t)
+    if np.issubdtype(part.dtype, np.inexact):
+        nan = np.isnan(part[..., n - 1])
+        if nan.any():
+            result[:, nan] = np.nan
+    return result.reshape(q.shape + result.shape[1:])
+
+
+def percentiles(x, p, axis=None, overwrite_input=False):
+    return quantiles(x, np.asarray(p, dtype=float) / 100, axis, overwrite_input)
+
+
+def group_quantiles(values, groups, q):
+    """Quantiles of values within each group, from one sort of the whole array.
+
+    Returns (keys, table) where table[i, j] is quantile q[j] of the values whose group is keys[i].
+    """
+    values, groups = np.asarray(values).reshape(-1), np.asarray(groups).reshape(-1)
+    if values.shape != groups.shape:
+        raise ValueError('values and groups must be the same length')
+    q = np.asarray(q, dtype=float).reshape(-1)
+    order = np.lexsort((values, groups))        # by group, then by value inside each group
+    keys, starts, counts = np.unique(groups[order], return_index=True, return_counts=True)
+    ordered = values[order]
+    virtual = q[None, :] * (counts[:, None] - 1)
+    lo = np.floor(virtual).astype(np.intp)
+    hi = np.minimum(lo + 1, counts[:, None] - 1)
+    table = _lerp(ordered[starts[:, None] + lo], ordered[starts[:, None] + hi], virtual - lo)
+    if np.issubdtype(ordered.dtype, np.inexact):
+        nan = np.isnan(ordered[starts + counts - 1])
+        table[nan] = np.nan
+    return keys, table
+
+
+##############################
+### Benchmark
+def benchmark(sizes=(10 ** 4, 10 ** 5, 10 ** 6), n_groups=1000, repeat=3):
+    rng = np.random.RandomState(0)
+    print('%-34s %10s %10s %10s %8s' % ('case', 'size', 'repeated', 'batched', 'speedup'))
+    for size in sizes:
+        x = rng.normal(size=size)
+
+        def repeated():
+            return [np.percentile(x, 25), np.median(x), np.percentile(x, 75)]
+
+        assert np.allclose(repeated(), quantiles(x, [0.25, 0.5, 0.75]))
+        t0 = best_time(repeated, repeat)
+        t1 = best_time(lambda: quantiles(x, [0.25, 0.5, 0.75]), repeat)
+        print('%-34s %10d %10.2f %10.2f %8.2f' % ('25/50/75', size, t0 * 1e3, t1 * 1e3, t0 / t1))
+
+        deciles = np.linspace(0.1, 0.9, 9)
+        t0 = best_time(lambda: [np.quantile(x, d) for d in deciles], repeat)
+        t1 = best_time(lambda: quantiles(x, deciles), repeat)
+        print('%-34s %10d %10.2f %10.2f %8.2f' % ('deciles', size, t0 * 1e3, t1 * 1e3, t0 / t1))
+
+        labels = rng.randint(0, n_groups, size)
+
+        def per_group():
+            return [np.quantile(x[labels == g], [0.25, 0.75]) for g in np.unique(labels)]
+
+        keys, table = group_quantiles(x, labels, [0.25, 0.75])
+        assert np.allclose(per_group(), table)
+        t0 = best_time(per_group, repeat)
+        t1 = best_time(lambda: group_quantiles(x, labels, [0.25, 0.75]), repeat)
+        print('%-34s %10d %10.2f %10.2f %8.2f' % ('25/75 per group (%d groups)' % n_groups,
+                                                  size, t0 * 1e3, t1 * 1e3, t0 / t1))
+
+
+if __name__ == '__main__':
+    benchmark()
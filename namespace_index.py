@@ -0,0 +1,159 @@
+### Cached namespace search for *Warning? / str.*find*? / obj? / obj??
+# The wildcard search in 1.1-docs.py walks the namespace and every attribute of every object
+# again on each query, and ?? re-reads source files each time. NamespaceIndex keeps:
+#   - the namespace's names, refreshed only for names that were added / rebound / deleted
+#   - attribute name lists of modules and classes, re-listed when a __dict__ (for classes, one
+#     along the MRO) changed size; instances are listed fresh every time
+#   - docstrings per object, and source per object invalidated by the file's mtime
+# Cached objects are only weakly referenced, so the index never keeps looked-up data alive.
+#
+# usage:
+#   idx = NamespaceIndex(globals())
+#   idx.lookup('*Warning?')         # names ending with Warning
+#   idx.lookup('str.*find*?')       # str methods containing 'find'
+#   idx.lookup('square?')           # docstring
+#   idx.lookup('square??')          # source
+import builtins
+import fnmatch
+import inspect
+import os
+import re
+import weakref
+
+
+class NamespaceIndex(object):
+    """Symbol index over a namespace dict (plus builtins), refreshed incrementally."""
+
+    def __init__(self, namespace, include_builtins=True):
+        self.namespace = namespace
+        self.include_builtins = include_builtins
+        self._snapshot = {}     # { name: id(value) } as of the last refresh
+        self._names = []        # sorted names of namespace + builtins
+        self._attrs = {}        # { id(obj): (weakref to obj, key, sorted attribute names) }
+        self._docs = {}         # { id(obj): (weakref to obj, doc) }
+        self._sources = {}      # { id(obj): (weakref to obj, filename, mtime, source) }
+        self.refresh()
+
+    ##############################
+    ### Invalidation
+    def refresh(self):
+        """Bring the name list up to date; drop cached entries for rebound or deleted names."""
+        current = {name: id(value) for name, value in list(self.namespace.items())}
+        if current == self._snapshot and self._names:
+            return
+        changed = {n for n, i in self._snapshot.items() if current.get(n) != i}
+        for name in changed:
+            stale = self._snapshot[name]
+            self._attrs.pop(stale, None)
+            self._docs.pop(stale, None)
+            self._sources.pop(stale, None)
+        self._snapshot = current
+        names = set(current)
+        if self.include_builtins:
+            names.update(vars(builtins))
+        self._names = sorted(names)
+
+    def _resolve(self, dotted):
+        parts = dotted.split('.')
+        if parts[0] in self.namespace:
+            obj = self.namespace[parts[0]]
+        elif self.include_builtins and hasattr(builtins, parts[0]):
+            obj = getattr(builtins, parts[0])
+        else:
+            raise NameError('name %r is not defined' % parts[0])
+        for part in parts[1:]:
+            obj = getattr(obj, part)
+        return obj
+
+    @staticmethod
+    def _cached(cache, obj):
+        entry = cache.get(id(obj))
+        return entry if entry is not None and entry[0]() is obj else None
+
+    @staticmethod
+    def _remember(cache, obj, *data):
+        # the entry goes away with obj; objects without weakref support (e.g. C builtins) aren't cached
+        try:
+            ref = weakref.ref(obj, lambda r, key=id(obj): cache.pop(key, None))
+        except TypeError:
+            return
+        cache[id(obj)] = (ref,) + data
+
+    def _attributes(self, obj):
+        # modules and classes change as attributes are set on them, so they are keyed by the size
+        # of their __dict__ (every class along the MRO); instances are cheap to dir() and are not
+        # cached, since their attributes can change at any time
+        if inspect.ismodule(obj):
+            key = len(vars(obj))
+        elif inspect.isclass(obj):
+            key = tuple(len(vars(c)) for c in inspect.getmro(obj))
+        else:
+            key = None
+        cached = self._cached(self._attrs, obj) if key is not None else None
+        if cached is not None and cached[1] == key:
+            return cached[2]
+        try:
+            names = sorted(dir(obj))
+        except Exception:
+            names = []
+        if key is not None:
+            self._remember(self._attrs, obj, key, names)
+        return names
+
+    ##############################
+    ### Queries
+    def search(self, pattern, show_all=False):
+        """Names matching a wildcard pattern such as '*Warning' or 'str.*find*'.
+
+        Like iPython, names starting with '_' are skipped unless the pattern asks for them.
+        """
+        self.refresh()
+        owner, _, leaf = pattern.rpartition('.')
+        if owner and any(c in owner for c in '*?['):
+            raise ValueError('wildcards are only supported in the last part of %r' % pattern)
+        names = self._attributes(self._resolve(owner)) if owner else self._names
+        hide_private = not show_all and not leaf.startswith('_')
+        regex = re.compile(fnmatch.translate(leaf))
+        prefix = owner + '.' if owner else ''
+        return [prefix + n for n in names
+                if regex.match(n) and not (hide_private and n.startswith('_'))]
+
+    def doc(self, dotted):
+        """Docstring of the named object (obj?)."""
+        self.refresh()
+        obj = self._resolve(dotted)
+        cached = self._cached(self._docs, obj)
+        if cached is not None:
+            return cached[1]
+        doc = inspect.getdoc(obj)
+        self._remember(self._docs, obj, doc)
+        return doc
+
+    def source(self, dotted):
+        """Source of the named object (obj??); None when there is none (e.g. C builtins)."""
+        self.refresh()
+        obj = self._resolve(dotted)
+        try:
+            filename = inspect.getsourcefile(obj) or inspect.getfile(obj)
+        except TypeError:
+            return None
+        mtime = os.path.getmtime(filename) if filename and os.path.exists(filename) else None
+        cached = self._cached(self._sources, obj)
+        if cached is not None and cached[1:3] == (filename, mtime):
+            return cached[3]
+        try:
+            source = inspect.getsource(obj)
+        except (OSError, TypeError):
+            source = None
+        self._remember(self._sources, obj, filename, mtime, source)
+        return source
+
+    def lookup(self, query):
+        """iPython-style query: 'pat*?' -> search, 'name?' -> doc, 'name??' -> source."""
+        query = query.strip()
+        if query.endswith('??'):
+            return self.source(query[:-2])
+        name = query[:-1] if query.endswith('?') else query
+        if any(c in name for c in '*['):
+            return self.search(name)
+        return self.doc(name)
@@ -0,0 +1,289 @@
+### NaN-skipping reductions without a masked copy
+# np.nansum(A), np.nanmean, np.nanvar, np.nanargmin... (2.4-aggregations.py, 3.04-missingData.py)
+# first build a copy of A with the NaNs replaced (0 for sums, +-inf for argmin), so a 10 GB array
+# briefly needs 20 GB. These kernels walk A in blocks of rows instead (rows longer than
+# BLOCK_BYTES are walked in strips along the last axis, so a (1, N) array is never copied whole),
+# skip NaNs through the reductions' where= mask (no replaced copy, only a block-sized boolean
+# mask), and also return how many valid elements went into every result. nanmin / nanmax use
+# fmin / fmax, which skip NaNs by themselves; there the block pass only adds the counts.
+#
+# Every function returns (result, count):
+#   s, n = nansum(A, axis=0)        # n[j] == number of non-NaN values in column j
+#   m, n = nanmean(A)
+#   v, n = nanvar(A, axis=1, ddof=1)
+#   i, n = nanargmin(A, axis=0)     # ValueError for an all-NaN slice, like np.nanargmin
+#
+# Empty and all-NaN slices follow numpy: sums are 0, mean / var / min / max are NaN (with a
+# RuntimeWarning) and n is 0; min / max / argmin of a zero-length axis raise ValueError.
+#
+#   python nan_kernels.py           # time and peak memory vs. numpy's nan-functions
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+BLOCK_BYTES = 4 * 2 ** 20      # rows per block: about this many bytes of input
+
+
+def _blocks(a):
+    rows = max(1, BLOCK_BYTES // max(1, a[:1].nbytes))
+    for r0 in range(0, a.shape[0], rows):
+        yield r0, a[r0:r0 + rows]
+
+
+def _strips(a):
+    # a is walked in strips along its last axis when even one row is over BLOCK_BYTES
+    row_bytes = a[:1].nbytes
+    if a.ndim < 2 or row_bytes <= BLOCK_BYTES:
+        yield 0, a
+        return
+    n = a.shape[-1]
+    cols = max(1, BLOCK_BYTES * n // row_bytes)
+    for c0 in range(0, n, cols):
+        yield c0, a[..., c0:c0 + cols]
+
+
+def _origin(ndim, r0, c0):
+    # position of a block's first element in the whole array
+    return (r0,) if ndim == 1 else (r0,) + (0,) * (ndim - 2) + (c0,)
+
+
+def _place(acc, p, axis, start, length):
+    # write one block's partials into result-sized arrays (allocated on first use) along axis 0
+    # or -1, rather than collecting them for np.concatenate, which would double the peak
+    if acc is None and p[0].shape[axis] == length:
+        return p        # the block spans the whole axis: nothing to assemble
+    if acc is None:
+        acc = tuple(np.empty((length,) + v.shape[1:] if axis == 0 else v.shape[:-1] + (length,), v.dtype)
+                    for v in p)
+    for out, v in zip(acc, p):
+        if axis == 0:
+            out[start:start + v.shape[0]] = v
+        else:
+            out[..., start:start + v.shape[-1]] = v
+    return acc
+
+
+def _normalize(a, axis):
+    a = np.asarray(a)
+    if a.ndim == 0:
+        a = a.reshape(1)
+    if axis is not None:
+        if not -a.ndim <= axis < a.ndim:
+            raise ValueError('axis %d is out of bounds for a %d-d array' % (axis, a.ndim))
+        axis %= a.ndim
+    return a, axis
+
+
+def _run(a, axis, part, combine):
+    # part(block, valid, axis, origin, shape) -> tuple of partial results for one block.
+    # Within a strip, reductions over rows (axis None / 0) combine the blocks' partials and any
+    # other axis stacks them; across strips, reductions over the last axis (or all axes)
+    # combine, and any other axis stacks along the result's last axis.
+    a, axis = _normalize(a, axis)
+    inexact = np.issubdtype(a.dtype, np.inexact)
+    if a.shape[0] == 0:
+        # no blocks to walk: reduce the empty array once for the identity / NaN and zero counts
+        return part(a, np.zeros(a.shape, bool) if inexact else None, axis, (0,) * a.ndim, a.shape)
+    last = a.ndim - 1
+    acc = None
+    for c0, strip in _strips(a):
+        strip_acc = None
+        for r0, block in _blocks(strip):
+            valid = ~np.isnan(block) if inexact else None
+            p = part(block, valid, axis, _origin(a.ndim, r0, c0), a.shape)
+            if axis is None or axis == 0:
+                strip_acc = p if strip_acc is None else combine(strip_acc, p)
+            else:
+                strip_acc = _place(strip_acc, p, 0, r0, a.shape[0])
+        if axis is None or last == 0 or axis == last:
+            acc = strip_acc if acc is None else combine(acc, strip_acc)
+        else:
+            acc = _place(acc, strip_acc, -1, c0, a.shape[-1])
+    return acc
+
+
+def _count(block, valid, axis):
+    if valid is None:
+        if axis is None:
+            return np.intp(block.size)
+        shape = block.shape[:axis] + block.shape[axis + 1:]
+        return np.full(shape, block.shape[axis], dtype=np.intp)
+    return np.count_nonzero(valid, axis=axis)
+
+
+def _warn_empty(count, what, stacklevel=3):
+    if np.any(count == 0):
+        warnings.warn(what, RuntimeWarning, stacklevel=stacklevel)
+
+
+def _expand(v, axis):
+    return v if axis is None else np.expand_dims(v, axis)
+
+
+##############################
+### Sum / mean / var
+def _sum_part(block, valid, axis, origin=None, shape=None):
+    return np.add.reduce(block, axis=axis, where=True if valid is None else valid), _count(block, valid, axis)
+
+
+def _sum_combine(a, b):
+    return a[0] + b[0], a[1] + b[1]
+
+
+def nansum(a, axis=None):
+    """Sum ignoring NaNs, and the number of values summed."""
+    return _run(a, axis, _sum_part, _sum_combine)
+
+
+def nanmean(a, axis=None):
+    """Mean ignoring NaNs (NaN where nothing is left), and the number of values averaged."""
+    s, count = nansum(a, axis)
+    _warn_empty(count, 'Mean of empty slice')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.true_divide(s, count), count
+
+
+def _var_part(block, valid, axis, origin, shape):
+    # per block: count, mean and sum of squared deviations (merged with Chan's formula)
+    s, count = _sum_part(block, valid, axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, np.true_divide(s, count), 0.0)
+    dev = block - _expand(mean, axis)
+    np.multiply(dev, dev, out=dev)
+    m2 = np.add.reduce(dev, axis=axis, where=True if valid is None else valid)
+    return count, mean, m2
+
+
+def _var_combine(a, b):
+    (na, ma, m2a), (nb, mb, m2b) = a, b
+    total = na + nb
+    delta = mb - ma
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = np.where(total > 0, np.true_divide(nb, total), 0.0)
+    return total, ma + delta * share, m2a + m2b + delta * delta * na * share
+
+
+def nanvar(a, axis=None, ddof=0):
+    """Variance ignoring NaNs, in one pass over the data, and the number of values used."""
+    count, mean, m2 = _run(a, axis, _var_part, _var_combine)
+    if np.any(count <= ddof):
+        warnings.warn('Degrees of freedom <= 0 for slice.', RuntimeWarning, stacklevel=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = np.true_divide(m2, count - ddof)
+    return np.where(count > ddof, var, np.nan), count
+
+
+def nanstd(a, axis=None, ddof=0):
+    var, count = nanvar(a, axis, ddof)
+    return np.sqrt(var), count
+
+
+##############################
+### Min / max / argmin / argmax
+def _extreme_part(ufunc):
+    # fmin / fmax already skip NaNs without replacing them, so no where= mask is needed
+    # (an empty reduction raises ValueError, as np.nanmin does)
+    return lambda block, valid, axis, origin, shape: (ufunc.reduce(block, axis=axis), _count(block, valid, axis))
+
+
+def _extreme(a, axis, ufunc):
+    value, count = _run(a, axis, _extreme_part(ufunc), lambda a, b: (ufunc(a[0], b[0]), a[1] + b[1]))
+    _warn_empty(count, 'All-NaN slice encountered', stacklevel=4)
+    return value, count
+
+
+def nanmin(a, axis=None):
+    """Minimum ignoring NaNs (NaN for an all-NaN slice), and the number of values compared."""
+    return _extreme(a, axis, np.fmin)
+
+
+def nanmax(a, axis=None):
+    """Maximum ignoring NaNs (NaN for an all-NaN slice), and the number of values compared."""
+    return _extreme(a, axis, np.fmax)
+
+
+def _arg_part(largest):
+    fill = -np.inf if largest else np.inf
+    pick = np.argmax if largest else np.argmin
+
+    def part(block, valid, axis, origin, shape):
+        count = _count(block, valid, axis)
+        vals = block if valid is None else np.where(valid, block, fill)     # block-sized only
+        idx = pick(vals, axis=axis)
+        best = vals.reshape(-1)[idx] if axis is None else np.take_along_axis(
+            vals, np.expand_dims(idx, axis), axis).squeeze(axis)
+        if valid is not None:
+            # the fill value may have beaten a real +-inf: point at the first real one instead
+            tie = (best == fill) & (count > 0)
+            if np.any(tie):
+                real = np.argmax(valid & (block == fill), axis=axis)
+                idx = np.where(tie, real, idx)
+        if axis is None:
+            # flat index into the whole array
+            pos = np.unravel_index(idx, block.shape)
+            idx = np.ravel_multi_index(tuple(p + o for p, o in zip(pos, origin)), shape)
+        elif axis == 0:
+            idx = idx + origin[0]
+        elif axis == block.ndim - 1:
+            idx = idx + origin[-1]
+        return best, idx, count
+    return part
+
+
+def _arg_combine(largest):
+    def combine(a, b):
+        (va, ia, na), (vb, ib, nb) = a, b
+        # strict comparison keeps the earlier block on ties, like np.argmin; empty blocks never win
+        take = (nb > 0) & ((na == 0) | ((vb > va) if largest else (vb < va)))
+        return np.where(take, vb, va), np.where(take, ib, ia), na + nb
+    return combine
+
+
+def _arg(a, axis, largest):
+    value, idx, count = _run(a, axis, _arg_part(largest), _arg_combine(largest))
+    if np.any(count == 0):
+        raise ValueError('All-NaN slice encountered')
+    return idx, count
+
+
+def nanargmin(a, axis=None):
+    """Index of the minimum ignoring NaNs, and the valid count. Raises on an all-NaN slice."""
+    return _arg(a, axis, largest=False)
+
+
+def nanargmax(a, axis=None):
+    """Index of the maximum ignoring NaNs, and the valid count. Raises on an all-NaN slice."""
+    return _arg(a, axis, largest=True)
+
+
+##############################
+### Benchmark
+def benchmark(shape=(2000, 5000), nan_fraction=0.1):
+    A = np.random.RandomState(0).rand(*shape)
+    A[A < nan_fraction] = np.nan
+    cases = [('nansum', np.nansum, nansum), ('nanmean', np.nanmean, nanmean),
+             ('nanvar', np.nanvar, nanvar), ('nanmin', np.nanmin, nanmin),
+             ('nanmax', np.nanmax, nanmax), ('nanargmin', np.nanargmin, nanargmin)]
+    print('input: %s, %.0f MB, %d%% NaN' % (shape, A.nbytes / 2 ** 20, nan_fraction * 100))
+    print('%-10s %5s %10s %10s %12s %12s' % ('func', 'axis', 'numpy ms', 'block ms', 'numpy peak MB', 'block peak MB'))
+    for name, ref, mine in cases:
+        for axis in (None, 0, 1):
+            row = []
+            for f in (ref, mine):
+                tracemalloc.start()
+                t0 = time.perf_counter()
+                result = f(A, axis=axis)
+                t = time.perf_counter() - t0
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                row.append((t, peak, result))
+            expected, (got, count) = row[0][2], row[1][2]
+            assert np.allclose(expected, got), (name, axis)
+            print('%-10s %5s %10.1f %10.1f %12.1f %12.1f' % (
+                name, axis, row[0][0] * 1e3, row[1][0] * 1e3, row[0][1] / 2 ** 20, row[1][1] / 2 ** 20))
+
+
+if __name__ == '__main__':
+    benchmark()
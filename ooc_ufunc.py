@@ -0,0 +1,139 @@
+### Out-of-core ufuncs over memory-mapped arrays
+# 2.3-npUFuncs.py uses out= to skip temporaries, but still assumes everything fits in RAM.
+# Here inputs are np.memmap / .npy files, and the ufunc (or chain of ufuncs) is applied block by
+# block into one preallocated buffer sized from a memory budget, then written to a memmapped
+# output. Peak RAM is ~budget no matter how big the arrays are.
+#
+# usage:
+#   big = np.load('big.npy', mmap_mode='r')                  # or just pass 'big.npy'
+#   recip = apply(np.divide, 1.0, big, out='recip.npy')      # 1.0 / big_arr
+#
+#   # -(0.5*x + 1) ** 2, one pass over x, no full-size temporaries:
+#   y = apply_chain([(np.multiply, 0.5), (np.add, 1), (np.power, 2), (np.negative,)],
+#                   'x.npy', out='y.npy', budget=512 * 2 ** 20)
+#
+#   # X marks where the running value goes when it isn't the first operand:
+#   apply_chain([(np.exp,), (np.divide, 1.0, X)], 'x.npy', out='y.npy')     # 1 / exp(x)
+import numpy as np
+
+BUDGET = 256 * 2 ** 20      # bytes of RAM for input blocks + output buffer
+
+
+class _Running(object):
+    def __repr__(self):
+        return 'X'
+
+X = _Running()      # placeholder for the running value in apply_chain steps
+
+
+def _open(operand):
+    if isinstance(operand, str):
+        return np.load(operand, mmap_mode='r')
+    return operand
+
+
+def _is_array(operand):
+    return isinstance(operand, np.ndarray) and operand.ndim > 0
+
+
+def _order(out, arrays):
+    # memory order to walk the blocks in: out's if given, else the first input's. np.save keeps
+    # F-contiguous arrays in Fortran order, so .npy memmaps can be either.
+    ref = out if isinstance(out, np.ndarray) else arrays[0]
+    return 'F' if ref.flags.f_contiguous and not ref.flags.c_contiguous else 'C'
+
+
+def _open_out(out, shape, dtype, order):
+    if out is None:
+        return np.empty(shape, dtype, order=order)
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=shape,
+                                         fortran_order=order == 'F')
+    if out.shape != shape:
+        raise ValueError('out has shape %s, expected %s' % (out.shape, shape))
+    if not (out.flags.c_contiguous or out.flags.f_contiguous):
+        raise ValueError('out must be contiguous so blocks can be written through a flat view')
+    return out
+
+
+def _flat(arr, order):
+    # 1-D view in the given memory order; only an operand laid out differently from the others
+    # (or a strided in-RAM view) gets copied
+    return arr.ravel(order)
+
+
+def _run_steps(first, rest, blocks, bufs, dtypes, m):
+    # the first ufunc reads the input blocks; each later step works in place on the running
+    # buffer unless it changes the dtype, then it writes into the buffer kept for its dtype
+    cur = first(*blocks, out=bufs[dtypes[0]][:m])
+    for (ufunc, args), dtype in zip(rest, dtypes[1:]):
+        cur = ufunc(*[cur if a is X else a for a in args], out=bufs[dtype][:m])
+    return cur
+
+
+def _normalize(steps):
+    out = []
+    for step in steps:
+        ufunc, args = step[0], list(step[1:])
+        if not any(a is X for a in args):
+            args.insert(0, X)
+        out.append((ufunc, args))
+    return out
+
+
+def _execute(first, operands, rest, out, budget):
+    operands = [_open(op) for op in operands]
+    arrays = [op for op in operands if _is_array(op)]
+    if not arrays:
+        raise ValueError('need at least one array operand')
+    shape = arrays[0].shape
+    for a in arrays[1:]:
+        if a.shape != shape:
+            raise ValueError('array operands must share one shape, got %s and %s' % (shape, a.shape))
+
+    # dtype of every step: run the chain on one element of each operand (a view, never a copy)
+    probe = [op[(slice(0, 1),) * op.ndim] if _is_array(op) else op for op in operands]
+    sample = first(*probe)
+    dtypes = [sample.dtype]
+    for ufunc, args in rest:
+        sample = ufunc(*[sample if a is X else a for a in args])
+        dtypes.append(sample.dtype)
+    dtype = dtypes[-1]
+
+    order = _order(out, arrays)
+    result = _open_out(out, shape, dtype, order)
+    flat_out = result.ravel(order)
+    flats = [_flat(op, order) if _is_array(op) else op for op in operands]
+    n = int(np.prod(shape))
+
+    # every array input block is read into RAM (page cache really) plus one buffer per step dtype
+    distinct = list(dict.fromkeys(dtypes))
+    per_element = sum(d.itemsize for d in distinct) + sum(a.dtype.itemsize for a in arrays)
+    block = max(1, min(n, budget // per_element))
+    bufs = {d: np.empty(block, d) for d in distinct}
+    for lo in range(0, n, block):
+        hi = min(lo + block, n)
+        flat_out[lo:hi] = _run_steps(first, rest, [op[lo:hi] if _is_array(op) else op for op in flats],
+                                     bufs, dtypes, hi - lo)
+    if isinstance(result, np.memmap):
+        result.flush()
+    return result
+
+
+def apply(ufunc, *operands, out=None, budget=BUDGET):
+    """ufunc(*operands) computed block by block. operands: arrays, memmaps, '.npy' paths or scalars.
+
+    out: None (in-RAM result), a '.npy' path (created as a memmap) or an existing array/memmap.
+    """
+    return _execute(ufunc, operands, [], out, budget)
+
+
+def apply_chain(steps, x, out=None, budget=BUDGET):
+    """Apply steps [(ufunc, *args), ...] to x in one blocked pass.
+
+    The running value goes first in each step unless X appears in args to place it.
+    """
+    steps = _normalize(steps)
+    first, args = steps[0]
+    operands = [x if a is X else a for a in args]
+    return _execute(first, operands, steps[1:], out, budget)
@@ -0,0 +1,238 @@
+### Size-bounded output history
+# iPython's Out dict (see 1.4-IOhistory.py) holds a strong reference to every result forever,
+# so a few big arrays/DataFrames in a long session can eat all the RAM.
+# OutHistory keeps the same Out[n] / _ / __ / ___ access, but with a memory budget: when the
+# budget is exceeded, least-recently-used entries are spilled to disk and reloaded on access.
+#   ndarrays   -> plain .npy, reloaded memory-mapped (read-only), so they cost ~no RAM after reload
+#   anything else -> zlib-compressed pickle
+#
+# usage:
+#   Out = OutHistory(budget=2 * 1024 ** 3)
+#   Out[2] = math.sin(2)
+#   Out[2] ** 2 + Out[3] ** 2
+#
+#   # or, inside iPython, record every cell result automatically:
+#   Out = install(get_ipython(), budget=2 * 1024 ** 3)
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import zlib
+from collections import OrderedDict
+from itertools import islice
+
+import numpy as np
+
+SIZE_SAMPLE = 1000      # containers longer than this are sized from their first SIZE_SAMPLE items
+
+
+def nbytes(obj, _seen=None):
+    """Rough in-memory size of obj in bytes (lists / tuples / sets / dicts include their items)."""
+    if isinstance(obj, (list, tuple, set, frozenset, dict)):
+        _seen = set() if _seen is None else _seen
+        if id(obj) in _seen:
+            return 0
+        _seen.add(id(obj))
+        items = obj.items() if isinstance(obj, dict) else obj
+        sample = list(islice(items, SIZE_SAMPLE))
+        if isinstance(obj, dict):
+            sample = [x for kv in sample for x in kv]
+        total = sum(nbytes(x, _seen) for x in sample)
+        if len(obj) > SIZE_SAMPLE:
+            total = total * len(obj) // SIZE_SAMPLE
+        return sys.getsizeof(obj) + total
+    if isinstance(obj, np.ndarray):
+        # memmaps (e.g. reloaded spills) are backed by the page cache, not by us
+        return 0 if isinstance(obj, np.memmap) or _is_mapped(obj) else obj.nbytes
+    memory_usage = getattr(obj, 'memory_usage', None)    # pandas Series / DataFrame
+    if callable(memory_usage):
+        try:
+            usage = memory_usage(deep=True)
+            return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+        except TypeError:
+            pass
+    return sys.getsizeof(obj)
+
+
+def _is_mapped(arr):
+    base = arr
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return True
+        base = base.base
+    return False
+
+
+class OutHistory(object):
+    """Out-like dict of {prompt number: result} with an LRU memory budget and spill-to-disk."""
+
+    def __init__(self, budget=1024 ** 3, spill_dir=None, compress_level=1):
+        self.budget = budget
+        self.compress_level = compress_level
+        self._own_dir = spill_dir is None
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix='out_history_')
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._mem = OrderedDict()   # { n: (value, size) }, oldest access first
+        self._disk = {}             # { n: path }
+        self._mapped = {}           # { n: path } for reloaded .npy spills still backing a memmap
+        self._unpicklable = set()   # entries that failed to spill: they stay in memory
+        self._order = []            # prompt numbers in insertion order, for _ / __ / ___
+        self.in_memory = 0
+
+    # --- dict interface
+    def __setitem__(self, n, value):
+        self._discard(n)
+        size = nbytes(value)
+        self._mem[n] = (value, size)
+        self.in_memory += size
+        self._order.append(n)
+        self._evict(keep=n)
+
+    def __getitem__(self, n):
+        if n in self._mem:
+            self._mem.move_to_end(n)
+            return self._mem[n][0]
+        if n in self._disk:
+            path = self._disk.pop(n)
+            value = self._load(path)
+            if path.endswith('.npy'):
+                self._mapped[n] = path
+            size = nbytes(value)
+            self._mem[n] = (value, size)
+            self.in_memory += size
+            self._evict(keep=n)
+            return value
+        raise KeyError(n)
+
+    def __delitem__(self, n):
+        if n not in self:
+            raise KeyError(n)
+        self._discard(n)
+
+    def __contains__(self, n):
+        return n in self._mem or n in self._disk
+
+    def __len__(self):
+        return len(self._mem) + len(self._disk)
+
+    def __iter__(self):
+        return iter(sorted(self.keys()))
+
+    def keys(self):
+        return list(self._mem) + list(self._disk)
+
+    def get(self, n, default=None):
+        return self[n] if n in self else default
+
+    # --- underscore shortcuts: _ / __ / ___
+    def last(self, k=1):
+        """k-th most recent output (1 -> _, 2 -> __, 3 -> ___)."""
+        live = [n for n in self._order if n in self]
+        return self[live[-k]] if len(live) >= k else None
+
+    _ = property(lambda self: self.last(1))
+    __ = property(lambda self: self.last(2))
+    ___ = property(lambda self: self.last(3))
+
+    def on_disk(self):
+        return sorted(self._disk)
+
+    def clear(self):
+        for n in list(self.keys()):
+            self._discard(n)
+        self._order = []
+
+    def close(self):
+        self.clear()
+        if self._own_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    # --- internals
+    def _discard(self, n):
+        if n in self._mem:
+            self.in_memory -= self._mem.pop(n)[1]
+        for files in (self._disk, self._mapped):
+            path = files.pop(n, None)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+        if n in self._order:
+            self._order.remove(n)
+        self._unpicklable.discard(n)
+
+    def _evict(self, keep=None):
+        # spill least-recently-used entries until under budget. The entry just stored / read is
+        # kept in memory even if it alone is over budget: the caller is about to use it.
+        for n in list(self._mem):
+            if self.in_memory <= self.budget:
+                break
+            if n == keep or self._mem[n][1] == 0 or n in self._unpicklable:
+                continue    # size 0 -> already memory-mapped, nothing to gain by spilling
+            value, size = self._mem[n]
+            try:
+                path = self._spill(n, value)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # lambdas, generators, open files, modules...: keep them in memory
+                self._unpicklable.add(n)
+                continue
+            del self._mem[n]
+            self.in_memory -= size
+            self._disk[n] = path
+
+    def _spill(self, n, value):
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            path = os.path.join(self.spill_dir, 'out_%s.npy' % n)
+            np.save(path, value)
+        else:
+            path = os.path.join(self.spill_dir, 'out_%s.pkl.z' % n)
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(path, 'wb') as f:
+                f.write(zlib.compress(data, self.compress_level))
+        return path
+
+    def _load(self, path):
+        if path.endswith('.npy'):
+            return np.load(path, mmap_mode='r')
+        with open(path, 'rb') as f:
+            value = pickle.loads(zlib.decompress(f.read()))
+        os.remove(path)
+        return value
+
+    def __del__(self):
+        try:
+            if self._own_dir:
+                shutil.rmtree(self.spill_dir, ignore_errors=True)
+        except Exception:
+            pass
+
+    def __repr__(self):
+        return '<OutHistory %d entries, %d on disk, %.1f/%.1f MB in memory>' % (
+            len(self), len(self._disk), self.in_memory / 2 ** 20, self.budget / 2 ** 20)
+
+
+def install(ip, budget=1024 ** 3, spill_dir=None, replace_out=True):
+    """Record every cell result of iPython shell ip into an OutHistory and return it.
+
+    With replace_out=True the shell's own output cache is turned off (cache_size=0) and emptied
+    (_oh and the _N variables), so iPython itself stops holding references: Out is the store,
+    and _ / __ / ___ are kept current here, since iPython no longer updates them.
+    """
+    history = OutHistory(budget, spill_dir)
+    ns = ip.user_ns
+
+    def post_run_cell(result):
+        if result.result is not None:
+            history[result.execution_count] = result.result
+            if replace_out:
+                ns['___'], ns['__'], ns['_'] = ns.get('__', ''), ns.get('_', ''), result.result
+
+    ip.events.register('post_run_cell', post_run_cell)
+    if replace_out:
+        ip.displayhook.cache_size = 0
+        old = ns.get('_oh')
+        if old is not None:
+            for n in list(old):
+                ns.pop('_%d' % n, None)
+            old.clear()
+        ns['Out'] = history
+    return history
@@ -0,0 +1,118 @@
+### Parallel prefix scan (ufunc.accumulate on several threads)
+# np.add.accumulate / np.multiply.accumulate (2.3-npUFuncs.py) are one serial loop. For an
+# associative ufunc the scan can be split in two parallel passes:
+#   1. every block scans itself from zero                       (threads, GIL released)
+#   2. block b gets op(carry_b, .) applied, where carry_b is the op-reduction of the last
+#      values of blocks 0..b-1 (a tiny serial scan over block totals)   (threads again)
+#
+# compensated=True (add only) bounds the float rounding error: each block is scanned in short
+# rows, and the row offsets are accumulated in extended precision, so the error grows with the
+# row length instead of with the array length.
+#
+# usage:
+#   y = parallel_accumulate(np.add, x)                  # == np.cumsum(x)
+#   parallel_accumulate(np.multiply, x, out=y, workers=8)
+#   parallel_accumulate(np.add, x, compensated=True)
+#
+#   python parallel_scan.py 100000000                   # benchmark vs np.cumsum
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bench_helpers import best_time, worker_counts as all_counts
+
+# ufuncs for which op(carry, local_scan) gives the global scan
+ASSOCIATIVE = (np.add, np.multiply, np.maximum, np.minimum, np.fmax, np.fmin,
+               np.logical_and, np.logical_or, np.logical_xor,
+               np.bitwise_and, np.bitwise_or, np.bitwise_xor)
+ROW = 1024              # row length for compensated scans
+MIN_BLOCK = 1 << 16     # smaller blocks aren't worth a thread hop
+
+
+def _compensated_block(x, out):
+    # scan in rows of ROW elements; row offsets in longdouble, rounded once per element
+    n = x.size
+    full = n - n % ROW
+    work = np.result_type(x.dtype, np.float64)
+    if full:
+        rows = x[:full].reshape(-1, ROW)
+        local = np.cumsum(rows, axis=1, dtype=work)
+        offsets = np.cumsum(local[:, -1], dtype=np.longdouble)
+        offsets = np.concatenate([[0], offsets[:-1]])
+        out[:full] = (local + offsets[:, None]).reshape(-1)
+        carry = offsets[-1] + local[-1, -1]
+    else:
+        carry = np.longdouble(0)
+    if full < n:
+        tail = np.cumsum(x[full:], dtype=work)
+        out[full:] = tail + carry
+    return out
+
+
+def parallel_accumulate(ufunc, x, out=None, workers=None, compensated=False, block=None):
+    """ufunc.accumulate(x) for 1-D x via a blocked two-pass scan over a thread pool."""
+    if ufunc not in ASSOCIATIVE:
+        raise ValueError('%s is not a supported associative ufunc' % getattr(ufunc, '__name__', ufunc))
+    if compensated and ufunc is not np.add:
+        raise ValueError('compensated=True is only available for np.add')
+    x = np.ascontiguousarray(x).reshape(-1)
+    if out is None:
+        out = np.empty(x.shape, ufunc.accumulate(x[:1]).dtype)
+    n = x.size
+    workers = workers or os.cpu_count() or 1
+    block = block or max(MIN_BLOCK, -(-n // workers))
+    starts = list(range(0, n, block))
+
+    def local(b0):
+        b1 = min(b0 + block, n)
+        if compensated:
+            _compensated_block(x[b0:b1], out[b0:b1])
+        else:
+            ufunc.accumulate(x[b0:b1], out=out[b0:b1])
+
+    if len(starts) <= 1:
+        for b0 in starts:
+            local(b0)
+        return out
+
+    def propagate(i):
+        b0 = starts[i]
+        b1 = min(b0 + block, n)
+        ufunc(out[b0:b1], carries[i - 1].astype(out.dtype), out=out[b0:b1])
+
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(local, starts))
+        # carries: scan of the block totals (serial, one value per block)
+        totals = out[[min(b0 + block, n) - 1 for b0 in starts]]
+        if compensated:
+            carries = np.cumsum(totals, dtype=np.longdouble)
+        else:
+            carries = ufunc.accumulate(totals)
+        list(pool.map(propagate, range(1, len(starts))))
+    return out
+
+
+##############################
+### Benchmark
+def benchmark(n=10 ** 8, worker_counts=None, repeat=3):
+    worker_counts = worker_counts or all_counts()
+    x = np.random.RandomState(0).rand(n)
+    out = np.empty_like(x)
+
+    exact = np.cumsum(x, dtype=np.longdouble)
+    base = best_time(lambda: np.cumsum(x, out=out), repeat)
+    err = float(np.max(np.abs(out - exact) / np.abs(exact)))
+    print('%-22s %10s %8s %12s' % ('n=%d' % n, 'ms', 'speedup', 'max rel err'))
+    print('%-22s %10.1f %8.2f %12.2g' % ('np.cumsum', base * 1e3, 1.0, err))
+    for compensated in (False, True):
+        for w in worker_counts:
+            t = best_time(lambda: parallel_accumulate(np.add, x, out=out, workers=w, compensated=compensated), repeat)
+            err = float(np.max(np.abs(out - exact) / np.abs(exact)))
+            label = '%d threads%s' % (w, ', compensated' if compensated else '')
+            print('%-22s %10.1f %8.2f %12.2g' % (label, t * 1e3, base / t, err))
+
+
+if __name__ == '__main__':
+    benchmark(int(float(sys.argv[1])) if len(sys.argv) > 1 else 10 ** 8)
@@ -0,0 +1,139 @@
+### Thread-parallel ufuncs
+# NumPy ufuncs (and scipy.special's, which are ufuncs too) release the GIL while they loop,
+# so the big examples in 2.3-npUFuncs.py -- 1.0 / big_arr, np.sin, np.exp, special.gamma,
+# special.erf -- can be split into chunks and run on several threads, all writing into one
+# shared output array.
+#
+# usage:
+#   y = parallel_apply(np.divide, 1.0, big_arr)
+#   parallel_apply(special.erf, x, out=y, workers=8)
+#
+#   python parallel_ufunc.py            # scaling table by function, size and thread count
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bench_helpers import best_time, worker_counts as all_counts
+
+CHUNK_CANDIDATES = (1 << 14, 1 << 16, 1 << 18, 1 << 20)    # elements per task
+TUNE_ELEMENTS = 1 << 22         # most elements a tuning run touches, whatever the worker count
+MIN_PARALLEL = 1 << 16      # below this many elements, threads cost more than they save
+
+_pools = {}
+_tuned = {}     # { (ufunc, dtypes, workers): chunk }
+
+
+def _pool(workers):
+    if workers not in _pools:
+        _pools[workers] = ThreadPoolExecutor(workers)
+    return _pools[workers]
+
+
+def _run(func, flats, flat_out, chunk, workers):
+    n = flat_out.size
+
+    def task(lo):
+        hi = min(lo + chunk, n)
+        func(*[f[lo:hi] if isinstance(f, np.ndarray) else f for f in flats], out=flat_out[lo:hi])
+
+    list(_pool(workers).map(task, range(0, n, chunk)))
+
+
+def tune_chunk(func, flats, flat_out, workers):
+    """Pick the fastest chunk size for func on a sample of the data; remembered per dtype."""
+    key = (func, tuple(f.dtype.str if isinstance(f, np.ndarray) else type(f).__name__ for f in flats),
+           workers)
+    if key in _tuned:
+        return _tuned[key]
+    n = flat_out.size
+    # time into a scratch output: out may be one of the operands (in-place calls), and trial runs
+    # writing into it would apply func to the start of the array several times over
+    scratch = np.empty(min(n, TUNE_ELEMENTS), flat_out.dtype)
+    best, best_rate = CHUNK_CANDIDATES[0], 0
+    for chunk in CHUNK_CANDIDATES:
+        m = min(n, chunk * workers * 4, TUNE_ELEMENTS)
+        sample = [f[:m] if isinstance(f, np.ndarray) else f for f in flats]
+        t0 = time.perf_counter()
+        _run(func, sample, scratch[:m], chunk, workers)
+        rate = m / max(time.perf_counter() - t0, 1e-9)
+        if rate > best_rate:
+            best, best_rate = chunk, rate
+        if m == n:
+            break   # the whole array fits in this sample; bigger chunks can't be measured
+    _tuned[key] = best
+    return best
+
+
+def parallel_apply(func, *operands, out=None, workers=None, chunk=None):
+    """func(*operands, out=out) split into chunks over a thread pool.
+
+    func: any ufunc (np.sin, special.erf, ...). Array operands must be C-contiguous and share
+    one shape; scalars are fine. chunk=None auto-tunes the chunk size.
+    """
+    workers = workers or os.cpu_count() or 1
+    arrays = [op for op in operands if isinstance(op, np.ndarray) and op.ndim > 0]
+    if not arrays:
+        return func(*operands, out=out) if out is not None else func(*operands)
+    shape = arrays[0].shape
+    for a in arrays:
+        if a.shape != shape:
+            raise ValueError('array operands must share one shape, got %s and %s' % (shape, a.shape))
+        if not a.flags.c_contiguous:
+            raise ValueError('array operands must be C-contiguous')
+    if out is None:
+        probe = func(*[op.reshape(-1)[:1] if isinstance(op, np.ndarray) and op.ndim else op
+                       for op in operands])
+        out = np.empty(shape, probe.dtype)
+    elif out.shape != shape or not out.flags.c_contiguous:
+        raise ValueError('out must be C-contiguous with shape %s' % (shape,))
+
+    flats = [op.reshape(-1) if isinstance(op, np.ndarray) and op.ndim else op for op in operands]
+    flat_out = out.reshape(-1)
+    if workers == 1 or flat_out.size < MIN_PARALLEL:
+        func(*flats, out=flat_out)
+        return out
+    chunk = chunk or tune_chunk(func, flats, flat_out, workers)
+    _run(func, flats, flat_out, chunk, workers)
+    return out
+
+
+def check_in_place(n=1 << 20, workers=4):
+    """out=x must give the same result as a plain in-place ufunc call (tuning included)."""
+    _tuned.clear()
+    x = np.ones(n)
+    parallel_apply(np.multiply, x, 2.0, out=x, workers=workers)
+    assert np.array_equal(x, np.full(n, 2.0)), 'in-place parallel_apply applied func more than once'
+
+
+##############################
+### Benchmark
+def benchmark(cases=None, sizes=(10 ** 5, 10 ** 6, 10 ** 7), worker_counts=None, repeat=3):
+    """Print best-of-repeat time and speedup vs. the plain ufunc call for each case."""
+    from scipy import special
+
+    if cases is None:
+        cases = [('1.0 / x', np.divide, lambda x: (1.0, x)),
+                 ('sin(x)', np.sin, lambda x: (x,)),
+                 ('exp(x)', np.exp, lambda x: (x,)),
+                 ('gamma(x)', special.gamma, lambda x: (x,)),
+                 ('erf(x)', special.erf, lambda x: (x,))]
+    worker_counts = worker_counts or all_counts()
+    rng = np.random.RandomState(0)
+    print('%-10s %10s %8s %10s %8s' % ('func', 'size', 'threads', 'ms', 'speedup'))
+    for name, func, make_args in cases:
+        for size in sizes:
+            args = make_args(rng.uniform(1, 5, size))
+            out = np.empty(size)
+            base = best_time(lambda: func(*args, out=out), repeat)
+            print('%-10s %10d %8s %10.2f %8s' % (name, size, 'numpy', base * 1e3, '1.00'))
+            for w in worker_counts:
+                parallel_apply(func, *args, out=out, workers=w)     # tune outside the timing
+                t = best_time(lambda: parallel_apply(func, *args, out=out, workers=w), repeat)
+                print('%-10s %10d %8d %10.2f %8.2f' % (name, size, w, t * 1e3, base / t))
+
+
+if __name__ == '__main__':
+    check_in_place()
+    benchmark()
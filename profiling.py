@@ -0,0 +1,446 @@
+### Plain-Python stand-ins for %prun / %lprun / %memit / %mprun
+# 1.7-timeExec.py needs iPython plus the line_profiler and memory_profiler extensions.
+# These work from any script, as context managers or decorators:
+#
+#   from profiling import profile_calls, profile_lines, profile_memory
+#   from mprun_demo import sum_of_lists
+#
+#   with profile_calls():                       # %prun sum_of_lists(1000000)
+#       sum_of_lists(1000000)
+#
+#   with profile_lines(sum_of_lists):           # %lprun -f sum_of_lists sum_of_lists(5000)
+#       sum_of_lists(5000)
+#
+#   with profile_memory(sum_of_lists):          # %memit / %mprun -f sum_of_lists ...
+#       sum_of_lists(1000000)
+#
+#   with profile_memory(pipeline_step, sample=0.05, json_file='mem.json'):   # long runs
+#       pipeline_step()
+#
+#   @profile_calls(collapsed='sum_of_lists.folded')   # flame graph input (flamegraph.pl, speedscope)
+#   def main(): ...
+#
+# Each profiler keeps its results on the object (.report() re-prints them) and prints
+# when the block exits unless quiet=True.
+import contextlib
+import cProfile
+import io
+import json
+import linecache
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+
+def _frame_label(code):
+    module = code.co_filename.rsplit('/', 1)[-1]
+    return '%s:%s:%d' % (module, getattr(code, 'co_qualname', code.co_name), code.co_firstlineno)
+
+
+_OWN_FILE = _frame_label.__code__.co_filename
+
+
+def _code_of(func):
+    func = getattr(func, '__wrapped__', func)
+    func = getattr(func, '__func__', func)      # bound / static / class methods
+    return func.__code__
+
+
+##############################
+### Function-level: %prun
+class profile_calls(contextlib.ContextDecorator):
+    """cProfile the block, or with collapsed= record full call stacks for flame graphs instead.
+
+    collapsed: None, True (keep in .folded) or a filename to write 'a;b;c <microseconds>' lines to.
+    """
+
+    def __init__(self, sort='cumulative', limit=25, collapsed=None, quiet=False, stream=None):
+        self.sort = sort
+        self.limit = limit
+        self.collapsed = collapsed
+        self.quiet = quiet
+        self.stream = stream
+        self.stats = None
+        self.folded = {}
+
+    def __enter__(self):
+        if self.collapsed:
+            # cProfile and the stack tracer both need sys.setprofile, so only one runs at a time
+            self._tracer = _StackTracer()
+            self._tracer.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.collapsed:
+            self._tracer.stop()
+            self.folded = self._tracer.folded()
+            if isinstance(self.collapsed, str):
+                with open(self.collapsed, 'w') as f:
+                    f.write(self.collapsed_text())
+        else:
+            self._profile.disable()
+            self.stats = pstats.Stats(self._profile, stream=io.StringIO())
+        if not self.quiet:
+            self.report()
+        return False
+
+    def collapsed_text(self):
+        return ''.join('%s %d\n' % (stack, us) for stack, us in sorted(self.folded.items()))
+
+    def report(self, stream=None):
+        stream = stream or self.stream or sys.stdout
+        if self.stats is not None:
+            self.stats.stream = stream
+            self.stats.sort_stats(self.sort).print_stats(self.limit)
+        else:
+            total = sum(self.folded.values())
+            stream.write('%d stacks, %.3f s total\n' % (len(self.folded), total / 1e6))
+            for stack, us in sorted(self.folded.items(), key=lambda kv: -kv[1])[:self.limit]:
+                stream.write('%10.3f ms  %s\n' % (us / 1e3, stack))
+
+
+class _StackTracer(object):
+    # sys.setprofile hook that charges elapsed time to the full call stack
+    # (self time only, so the folded totals add up like a flame graph expects)
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.stack = []
+
+    def start(self):
+        self.last = time.perf_counter()
+        self._previous = sys.getprofile()
+        sys.setprofile(self._hook)
+
+    def stop(self):
+        sys.setprofile(self._previous)
+        self._charge(time.perf_counter())
+
+    def _charge(self, now):
+        if self.stack:
+            self.times[tuple(self.stack)] += now - self.last
+        self.last = now
+
+    def _hook(self, frame, event, arg):
+        now = time.perf_counter()
+        self._charge(now)
+        if frame.f_code.co_filename == _OWN_FILE:
+            # profile_calls.__exit__, stop() and the C calls they make stay out of the stacks
+            pass
+        elif event == 'call':
+            self.stack.append(_frame_label(frame.f_code))
+        elif event == 'c_call':
+            self.stack.append('<builtin>:%s' % getattr(arg, '__qualname__', arg))
+        elif event in ('return', 'c_return', 'c_exception') and self.stack:
+            self.stack.pop()
+        self.last = time.perf_counter()     # don't bill the hook's own overhead
+
+    def folded(self):
+        return {';'.join(stack): int(round(t * 1e6)) for stack, t in self.times.items() if t > 0}
+
+
+##############################
+### Line-level: %lprun
+class _LineTracer(contextlib.ContextDecorator):
+    # base for per-line profilers: traces only frames running one of the target code objects.
+    # Uses sys.monitoring (3.12+) when available, which only fires for the targets,
+    # and sys.settrace otherwise.
+
+    def __init__(self, *funcs, quiet=False, stream=None):
+        self.codes = {_code_of(f) for f in funcs}
+        self.quiet = quiet
+        self.stream = stream
+        self.hits = defaultdict(int)        # { (code, lineno): count }
+        self._current = {}                  # { frame: (lineno, start mark) }
+
+    # subclasses: _mark() samples the resource, _charge(key, start, end) records it
+    def _mark(self):
+        raise NotImplementedError
+
+    def _charge(self, key, start, end):
+        raise NotImplementedError
+
+    def _line(self, frame, lineno):
+        mark = self._mark()
+        previous = self._current.get(frame)
+        if previous is not None:
+            self._charge((frame.f_code, previous[0]), previous[1], mark)
+        self.hits[(frame.f_code, lineno)] += 1
+        self._current[frame] = (lineno, self._mark())
+
+    def _leave(self, frame):
+        previous = self._current.pop(frame, None)
+        if previous is not None:
+            self._charge((frame.f_code, previous[0]), previous[1], self._mark())
+
+    # --- settrace backend
+    def _global_trace(self, frame, event, arg):
+        if event == 'call' and frame.f_code in self.codes:
+            return self._local_trace
+        return None
+
+    def _local_trace(self, frame, event, arg):
+        if event == 'line':
+            self._line(frame, frame.f_lineno)
+        elif event == 'return':
+            self._leave(frame)
+        return self._local_trace
+
+    # --- sys.monitoring backend
+    def _start_monitoring(self):
+        mon = sys.monitoring
+        for tool_id in range(mon.PROFILER_ID, 6):
+            if mon.get_tool(tool_id) is None:
+                break
+        else:
+            return False
+        self._tool = tool_id
+        mon.use_tool_id(tool_id, 'pdsh-profiling')
+        # PY_UNWIND can't be a local event, so it's set globally and filtered in the callback
+        events = mon.events.LINE | mon.events.PY_RETURN
+        mon.register_callback(tool_id, mon.events.LINE,
+                              lambda code, lineno: self._line(sys._getframe(1), lineno))
+        mon.register_callback(tool_id, mon.events.PY_RETURN,
+                              lambda code, offset, retval: self._leave(sys._getframe(1)))
+        mon.register_callback(tool_id, mon.events.PY_UNWIND,
+                              lambda code, offset, exc: code in self.codes and self._leave(sys._getframe(1)))
+        mon.set_events(tool_id, mon.events.PY_UNWIND)
+        for code in self.codes:
+            mon.set_local_events(tool_id, code, events)
+        return True
+
+    def _stop_monitoring(self):
+        mon = sys.monitoring
+        for code in self.codes:
+            mon.set_local_events(self._tool, code, 0)
+        mon.set_events(self._tool, 0)
+        for event in (mon.events.LINE, mon.events.PY_RETURN, mon.events.PY_UNWIND):
+            mon.register_callback(self._tool, event, None)
+        mon.free_tool_id(self._tool)
+
+    def __enter__(self):
+        self._monitoring = hasattr(sys, 'monitoring') and self._start_monitoring()
+        if not self._monitoring:
+            self._previous = sys.gettrace()
+            sys.settrace(self._global_trace)
+        return self
+
+    def __exit__(self, *exc):
+        if self._monitoring:
+            self._stop_monitoring()
+        else:
+            sys.settrace(self._previous)
+        for frame in list(self._current):
+            self._leave(frame)
+        if not self.quiet:
+            self.report()
+        return False
+
+    def _lines_of(self, code):
+        filename = code.co_filename
+        lines = sorted({lineno for (c, lineno) in self.hits if c is code})
+        if not lines:
+            return []
+        first, last = min(code.co_firstlineno, lines[0]), lines[-1]
+        return [(n, linecache.getline(filename, n).rstrip()) for n in range(first, last + 1)]
+
+
+class profile_lines(_LineTracer):
+    """Per-line hit counts and wall time for the given functions (%lprun -f ...)."""
+
+    def __init__(self, *funcs, quiet=False, stream=None):
+        _LineTracer.__init__(self, *funcs, quiet=quiet, stream=stream)
+        self.times = defaultdict(float)     # { (code, lineno): seconds }
+
+    _mark = staticmethod(time.perf_counter)
+
+    def _charge(self, key, start, end):
+        self.times[key] += end - start
+
+    def report(self, stream=None):
+        stream = stream or self.stream or sys.stdout
+        for code in self.codes:
+            total = sum(t for (c, n), t in self.times.items() if c is code)
+            stream.write('Total time: %g s\nFile: %s\nFunction: %s at line %d\n\n'
+                         % (total, code.co_filename, code.co_name, code.co_firstlineno))
+            stream.write('%6s %9s %12s %10s %8s  %s\n'
+                         % ('Line #', 'Hits', 'Time (us)', 'Per Hit', '% Time', 'Line Contents'))
+            for lineno, text in self._lines_of(code):
+                hits = self.hits.get((code, lineno), 0)
+                if hits:
+                    t = self.times.get((code, lineno), 0.0)
+                    stream.write('%6d %9d %12.1f %10.1f %8.1f  %s\n' % (
+                        lineno, hits, t * 1e6, t * 1e6 / hits, 100 * t / total if total else 0, text))
+                else:
+                    stream.write('%6d %9s %12s %10s %8s  %s\n' % (lineno, '', '', '', '', text))
+            stream.write('\n')
+
+
+##############################
+### Memory: %memit / %mprun
+# Unlike %mprun, the target functions can live anywhere: a script, the iPython prompt or
+# exec'd code. tracemalloc tags allocations with filename + line, and only the line range of
+# each target's code object is kept. Source text shows up where linecache can find it.
+def _line_range(code):
+    # first..last line of code and of any code objects nested in it (comprehensions, lambdas)
+    lines = [code.co_firstlineno]
+    stack = [code]
+    while stack:
+        c = stack.pop()
+        lines.extend(l for _, _, l in c.co_lines() if l is not None)
+        stack.extend(k for k in c.co_consts if hasattr(k, 'co_lines'))
+    return min(lines), max(lines)
+
+
+class profile_memory(_LineTracer):
+    """tracemalloc-based peak/increment for the block (%memit), per line for any given functions (%mprun).
+
+    Per line: net increment (bytes still alive when the line finished) and peak growth above the
+    line's starting level. sample=seconds swaps line tracing for periodic tracemalloc snapshots:
+    much lower overhead on long pipelines, at the cost of hit counts and of peaks shorter than
+    the interval.
+
+    Only allocations made through Python's allocators are seen (NumPy's data buffers included),
+    so numbers are traced bytes rather than process RSS.
+    """
+
+    def __init__(self, *funcs, sample=None, quiet=False, stream=None, json_file=None):
+        _LineTracer.__init__(self, *funcs, quiet=quiet, stream=stream)
+        self.sample = sample
+        self.json_file = json_file
+        self.increments = defaultdict(int)  # { (code, lineno): net bytes }
+        self.peaks = defaultdict(int)       # { (code, lineno): max growth while on that line }
+        self.peak = self.increment = 0
+
+    def _mark(self):
+        return tracemalloc.get_traced_memory()[0]
+
+    def _charge(self, key, start, end):
+        self.increments[key] += end - start
+        peak = tracemalloc.get_traced_memory()[1]
+        self._peak = max(self._peak, peak)
+        self.peaks[key] = max(self.peaks[key], peak - start)
+
+    def _line(self, frame, lineno):
+        _LineTracer._line(self, frame, lineno)
+        tracemalloc.reset_peak()    # so the next _charge sees this line's peak only
+
+    # --- sampling backend
+    def _sample_loop(self, interval, filters, ranges, base):
+        while not self._stop.wait(interval):
+            self._record_sample(base, self._snapshot_lines(filters, ranges))
+        final = self._snapshot_lines(filters, ranges)
+        self._record_sample(base, final)
+        for key in set(base) | set(final):
+            self.increments[key] = final.get(key, 0) - base.get(key, 0)
+
+    def _snapshot_lines(self, filters, ranges):
+        sizes = defaultdict(int)
+        snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+        for stat in snapshot.statistics('lineno'):
+            frame = stat.traceback[0]
+            for code, (first, last) in ranges.items():
+                if frame.filename == code.co_filename and first <= frame.lineno <= last:
+                    sizes[(code, frame.lineno)] += stat.size
+        return sizes
+
+    def _record_sample(self, base, sizes):
+        for key, size in sizes.items():
+            self.peaks[key] = max(self.peaks[key], size - base.get(key, 0))
+        self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+
+    def __enter__(self):
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        self._base = self._mark()
+        self._peak = 0
+        tracemalloc.reset_peak()
+        if self.codes and self.sample:
+            # the baseline is taken here, not on the thread: anything the block allocates before
+            # the thread first runs would otherwise count as baseline
+            filters = [tracemalloc.Filter(True, code.co_filename) for code in self.codes]
+            ranges = {code: _line_range(code) for code in self.codes}
+            base = self._snapshot_lines(filters, ranges)
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample_loop, daemon=True,
+                                            args=(self.sample, filters, ranges, base))
+            self._thread.start()
+        elif self.codes:
+            _LineTracer.__enter__(self)
+        return self
+
+    def __exit__(self, *exc):
+        current, peak = tracemalloc.get_traced_memory()
+        if self.codes and self.sample:
+            self._stop.set()
+            self._thread.join()
+        elif self.codes:
+            quiet, self.quiet = self.quiet, True
+            _LineTracer.__exit__(self, *exc)
+            self.quiet = quiet
+        self.increment = current - self._base
+        self.peak = max(peak, self._peak) - self._base
+        if self._started:
+            tracemalloc.stop()
+        if self.json_file:
+            with open(self.json_file, 'w') as f:
+                json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+        if not self.quiet:
+            self.report()
+        return False
+
+    def _rows(self, code):
+        # (lineno, hits, increment, peak, text) for every line of code
+        first, last = _line_range(code)
+        for lineno in range(first, last + 1):
+            key = (code, lineno)
+            yield (lineno, self.hits.get(key, 0), self.increments.get(key, 0), self.peaks.get(key, 0),
+                   linecache.getline(code.co_filename, lineno).rstrip())
+
+    def to_dict(self):
+        """Plain-data report. Keys are 'file:function' and line numbers, so two runs diff cleanly."""
+        functions = {}
+        for code in sorted(self.codes, key=lambda c: (c.co_filename, c.co_firstlineno)):
+            functions['%s:%s' % (code.co_filename, code.co_name)] = {
+                str(lineno): {'hits': hits, 'increment': inc, 'peak': peak, 'source': text}
+                for lineno, hits, inc, peak, text in self._rows(code)
+                if hits or inc or peak}
+        return {'mode': 'sample' if self.sample else 'trace',
+                'peak': self.peak, 'increment': self.increment, 'functions': functions}
+
+    def report(self, stream=None):
+        stream = stream or self.stream or sys.stdout
+        stream.write('peak memory: %.2f MiB, increment: %.2f MiB\n'
+                     % (self.peak / 2 ** 20, self.increment / 2 ** 20))
+        for code in sorted(self.codes, key=lambda c: (c.co_filename, c.co_firstlineno)):
+            stream.write('\nFilename: %s\n\n%6s %9s %14s %14s  %s\n'
+                         % (code.co_filename, 'Line #', 'Hits', 'Increment', 'Peak growth', 'Line Contents'))
+            for lineno, hits, inc, peak, text in self._rows(code):
+                if hits or inc or peak:
+                    stream.write('%6d %9s %10.3f MiB %10.3f MiB  %s\n' % (
+                        lineno, hits or '-', inc / 2 ** 20, peak / 2 ** 20, text))
+                else:
+                    stream.write('%6d %9s %14s %14s  %s\n' % (lineno, '', '', '', text))
+
+
+def diff_memory_reports(old, new, stream=sys.stdout, threshold=0):
+    """Print per-line increment / peak changes between two profile_memory.to_dict() reports."""
+    stream.write('peak: %+.3f MiB, increment: %+.3f MiB\n' % (
+        (new['peak'] - old['peak']) / 2 ** 20, (new['increment'] - old['increment']) / 2 ** 20))
+    for func in sorted(set(old['functions']) | set(new['functions'])):
+        a, b = old['functions'].get(func, {}), new['functions'].get(func, {})
+        for lineno in sorted(set(a) | set(b), key=int):
+            ra, rb = a.get(lineno, {}), b.get(lineno, {})
+            d_inc = rb.get('increment', 0) - ra.get('increment', 0)
+            d_peak = rb.get('peak', 0) - ra.get('peak', 0)
+            if abs(d_inc) > threshold or abs(d_peak) > threshold:
+                stream.write('%s:%s  increment %+.3f MiB  peak %+.3f MiB  %s\n' % (
+                    func, lineno, d_inc / 2 ** 20, d_peak / 2 ** 20,
+                    (rb or ra).get('source', '').strip()))
@@ -0,0 +1,274 @@
+### Headless runner for the numbered chapter scripts
+# The chapter notes (1.0-iPython.py ... 5.03-Hyperparams+Validation.py) are written for iPython:
+# they use %timeit, %matplotlib inline, !ls, obj? and so on. This translates the magics into
+# plain Python, runs every script in its own interpreter under the Agg backend (several at once),
+# and prints wall time, CPU time, peak RSS and import time per script.
+#
+# usage:
+#   python run_chapters.py                  # all scripts
+#   python run_chapters.py 2.* 3.0*         # glob patterns
+#   python run_chapters.py -j 8 --json chapters.json
+#   python run_chapters.py --lazy           # heavy imports deferred, compare the import column
+#   python run_chapters.py --show 1.7-timeExec.py      # print the translated source only
+import argparse
+import fnmatch
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_PATTERN = re.compile(r'^\d+(\.\d+)?-.*\.py$')
+TIMEIT_NUMBER = 1       # loops per %timeit: we want the statement exercised, not benchmarked
+
+# magics whose argument is itself a statement worth running
+RUN_ARG_MAGICS = ('time', 'timeit', 'prun', 'memit')
+# magics with a '-f func' option before the statement
+FUNC_ARG_MAGICS = ('lprun', 'mprun')
+
+
+##############################
+### Translating iPython syntax
+def _indent(line):
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _strip_comment(text):
+    # drop a trailing '# ...' comment that isn't inside a string literal (good enough for notes)
+    quote = None
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '\'"':
+            quote = ch
+        elif ch == '#':
+            return text[:i].rstrip()
+    return text.rstrip()
+
+
+def _timeit_call(stmt, number):
+    return 'timeit.timeit(%r, globals=globals(), number=%d)' % (stmt, number)
+
+
+def _shell_call(cmd):
+    return ('subprocess.run(%r, shell=True, stdout=subprocess.PIPE, '
+            'universal_newlines=True).stdout.splitlines()' % cmd)
+
+
+def translate_line(line, timeit_number=TIMEIT_NUMBER):
+    """Return the plain-Python version of one iPython line."""
+    indent, body = _indent(line), line.strip()
+    code = _strip_comment(body)
+    if not code:
+        return line
+    # var = !cmd
+    m = re.match(r'^([A-Za-z_]\w*)\s*=\s*!(.*)$', code)
+    if m:
+        return '%s%s = %s' % (indent, m.group(1), _shell_call(m.group(2).strip()))
+    # !cmd
+    if code.startswith('!'):
+        return '%s%s' % (indent, _shell_call(code[1:].strip()))
+    # %magic args
+    m = re.match(r'^%(\w+)\s*(.*)$', code)
+    if m:
+        name, args = m.group(1), m.group(2).strip()
+        if name == 'timeit' and args and not args.endswith('?'):
+            return indent + _timeit_call(args, timeit_number)
+        if name in RUN_ARG_MAGICS and args and not args.endswith('?'):
+            return indent + args
+        if name in FUNC_ARG_MAGICS:
+            stmt = re.sub(r'^(-f\s+\S+\s*)+', '', args)
+            if stmt and stmt != args:
+                return indent + stmt
+        return '%spass  # %s' % (indent, body)
+    # obj? / obj?? / *Warning?  (help lookups)
+    if re.match(r'^[\w.*\[\]]+\?{1,2}$', code):
+        return '%spass  # %s' % (indent, body)
+    return line
+
+
+def translate(source, timeit_number=TIMEIT_NUMBER):
+    """Translate a whole iPython-flavoured script into plain Python source."""
+    out = ['import subprocess, timeit  # added by run_chapters']
+    lines = source.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        code = _strip_comment(line.strip())
+        m = re.match(r'^%%(\w+)\s*(.*)$', code)
+        if m:
+            # cell magic: the cell is everything up to the next blank line
+            cell = []
+            i += 1
+            while i < len(lines) and lines[i].strip():
+                cell.append(lines[i])
+                i += 1
+            name = m.group(1)
+            out.append('pass  # %s' % line.strip())
+            if name in ('timeit', 'time', 'prun', 'memit'):
+                if name == 'timeit':
+                    out.append(_timeit_call('\n'.join(cell), timeit_number))
+                else:
+                    out.extend(cell)
+            else:
+                # %%file etc.: don't run, and certainly don't overwrite files in the repo
+                out.extend('# ' + c for c in cell)
+            continue
+        out.append(translate_line(line, timeit_number))
+        i += 1
+    return _comment_out_syntax_errors('\n'.join(out) + '\n')
+
+
+def _comment_out_syntax_errors(source, max_fixes=200):
+    # The notes also contain prose-ish lines (shell commands, 'ipdb > print(b)', stray indents).
+    # Comment out whatever line the compiler complains about until it compiles.
+    lines = source.splitlines()
+    for attempt in range(max_fixes):
+        try:
+            compile('\n'.join(lines), '<translated>', 'exec')
+            break
+        except SyntaxError as e:
+            n = (e.lineno or 1) - 1
+            if not 0 <= n < len(lines) or lines[n].startswith('# [syntax]'):
+                break
+            lines[n] = '# [syntax] ' + lines[n]
+    return '\n'.join(lines) + '\n'
+
+
+##############################
+### Running
+# child bootstrap: run the translated script, then dump its own rusage + any exception
+_CHILD = """
+import json, os, resource, runpy, sys, traceback
+script, report = sys.argv[1], sys.argv[2]
+if os.environ.get('RUN_CHAPTERS_LAZY'):
+    import lazy_imports; lazy_imports.enable()
+sys.argv = [script]
+error = None
+try:
+    runpy.run_path(script, run_name='__main__')
+except BaseException as e:
+    error = traceback.format_exception_only(type(e), e)[-1].strip()
+ru = resource.getrusage(resource.RUSAGE_SELF)
+with open(report, 'w') as f:
+    json.dump({'cpu': ru.ru_utime + ru.ru_stime, 'peak_rss': ru.ru_maxrss * 1024, 'error': error}, f)
+"""
+
+
+def _import_time(stderr):
+    # -X importtime prints 'import time: self | cumulative | package', nested imports indented.
+    # Sum the cumulative column of the top-level ones.
+    total = 0
+    for line in stderr.splitlines():
+        m = re.match(r'^import time:\s+\d+\s+\|\s+(\d+)\s+\|( *)\S', line)
+        if m and len(m.group(2)) <= 1:
+            total += int(m.group(1))
+    return total / 1e6
+
+
+def run_script(path, timeout=600, timeit_number=TIMEIT_NUMBER, lazy=False):
+    """Run one chapter script headless, return a dict of measurements."""
+    with open(path) as f:
+        source = translate(f.read(), timeit_number)
+    name = os.path.basename(path)
+    tmpdir = tempfile.mkdtemp(prefix='run_chapters_')
+    script = os.path.join(tmpdir, name.replace('-', '_'))
+    report = os.path.join(tmpdir, 'report.json')
+    with open(script, 'w') as f:
+        f.write(source)
+    env = dict(os.environ, MPLBACKEND='Agg', PYTHONPATH=os.pathsep.join(
+        p for p in (ROOT, os.environ.get('PYTHONPATH')) if p))
+    if lazy:
+        env['RUN_CHAPTERS_LAZY'] = '1'
+    result = {'script': name, 'status': 'ok', 'error': None}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', _CHILD, script, report],
+                            cwd=ROOT, env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    try:
+        stderr = proc.communicate(timeout=timeout)[1]
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        stderr = proc.communicate()[1]
+        result['status'] = 'timeout'
+    result['wall'] = time.perf_counter() - t0
+    result['import'] = _import_time(stderr)
+    try:
+        with open(report) as f:
+            child = json.load(f)
+    except (OSError, ValueError):
+        child = {'cpu': None, 'peak_rss': None,
+                 'error': None if result['status'] == 'timeout' else 'exit code %d' % proc.returncode}
+    result.update(child)
+    if result['error'] and result['status'] == 'ok':
+        result['status'] = 'error'
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return result
+
+
+def find_scripts(patterns=None):
+    names = sorted(n for n in os.listdir(ROOT) if SCRIPT_PATTERN.match(n))
+    if patterns:
+        names = [n for n in names if any(fnmatch.fnmatch(n, p) for p in patterns)]
+    return [os.path.join(ROOT, n) for n in names]
+
+
+def run_all(patterns=None, jobs=None, timeout=600, timeit_number=TIMEIT_NUMBER, lazy=False):
+    # each script already runs in its own interpreter, so threads are enough to drive the pool
+    scripts = find_scripts(patterns)
+    with ThreadPoolExecutor(jobs or os.cpu_count() or 1) as pool:
+        return list(pool.map(lambda p: run_script(p, timeout, timeit_number, lazy), scripts))
+
+
+def _num(value, fmt):
+    return '-' if value is None else fmt % value
+
+
+def print_table(results, stream=sys.stdout):
+    stream.write('%-36s %8s %8s %9s %8s  %s\n'
+                 % ('script', 'wall s', 'cpu s', 'peak MB', 'import s', 'status'))
+    for r in results:
+        status = r['status'] if not r['error'] else '%s: %s' % (r['status'], r['error'])
+        stream.write('%-36s %8s %8s %9s %8s  %s\n' % (
+            r['script'], _num(r['wall'], '%.2f'), _num(r['cpu'], '%.2f'),
+            _num(r['peak_rss'] and r['peak_rss'] / 2 ** 20, '%.1f'), _num(r['import'], '%.2f'),
+            status[:80]))
+    total = sum(r['wall'] for r in results)
+    failed = sum(r['status'] != 'ok' for r in results)
+    stream.write('%d scripts, %d failed, %.1f s total wall time\n' % (len(results), failed, total))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run the chapter scripts headless')
+    parser.add_argument('patterns', nargs='*', help='glob patterns of scripts to run (default: all)')
+    parser.add_argument('-j', '--jobs', type=int, help='scripts run at once (default: cpu count)')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds per script')
+    parser.add_argument('--timeit-number', type=int, default=TIMEIT_NUMBER,
+                        help='loops each translated %%timeit runs')
+    parser.add_argument('--lazy', action='store_true',
+                        help='import the heavy packages lazily (see lazy_imports.py)')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--show', metavar='SCRIPT', help='print the translated source and exit')
+    args = parser.parse_args(argv)
+
+    if args.show:
+        with open(args.show) as f:
+            sys.stdout.write(translate(f.read(), args.timeit_number))
+        return 0
+    results = run_all(args.patterns, args.jobs, args.timeout, args.timeit_number, args.lazy)
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    return 1 if any(r['status'] != 'ok' for r in results) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+### Streaming capture of shell output
+# 'directory = !ls' (1.5-shell.py) buffers the whole output into an SList before returning,
+# which stalls and eats memory on a find / grep that prints millions of lines.
+# stream() returns right away with a lazy line iterator reading from the subprocess pipe.
+#   keep=N   only the last N lines are retained (ring buffer) for looking at afterwards
+#   grep=pat lines are filtered by regex as they arrive, one chunk of output at a time
+#
+# usage:
+#   for line in stream('find / -name "*.py"', grep=r'site-packages'):
+#       ...
+#   out = stream('dmesg', keep=100); out.consume(); out.tail     # last 100 lines only
+#   with stream('tail -f app.log', grep='ERROR') as lines:
+#       for line in lines: ...
+import collections
+import re
+import subprocess
+
+CHUNK = 1 << 16     # bytes read from the pipe per step
+
+
+class ShellStream(object):
+    """Iterator over the lines of a running shell command's stdout."""
+
+    def __init__(self, cmd, keep=None, grep=None, flags=0, chunk=CHUNK, encoding='utf-8'):
+        self.cmd = cmd
+        self.chunk = chunk
+        self.encoding = encoding
+        self.tail = collections.deque(maxlen=keep) if keep else None
+        # matching whole lines inside a chunk lets re scan the chunk in one C-level pass
+        self.pattern = re.compile(r'^.*(?:%s).*$' % grep, re.M | flags) if grep else None
+        self.count = 0              # lines yielded so far
+        self.proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, bufsize=0)
+        self._lines = self._generate()
+
+    def _chunks(self):
+        # yield text blocks that end on a line boundary
+        partial = b''
+        read = self.proc.stdout.read
+        while True:
+            data = read(self.chunk)
+            if not data:
+                break
+            data = partial + data
+            cut = data.rfind(b'\n') + 1
+            partial = data[cut:]
+            if cut:
+                yield data[:cut].decode(self.encoding, 'replace')
+        if partial:
+            yield partial.decode(self.encoding, 'replace') + '\n'
+
+    def _generate(self):
+        try:
+            for text in self._chunks():
+                if self.pattern is not None:
+                    lines = [m.group(0) for m in self.pattern.finditer(text)]
+                else:
+                    # '\n' only, like the grep= path (splitlines() would also split on \r, \x0c, ...)
+                    lines = text.split('\n')[:-1]
+                if self.tail is not None:
+                    self.tail.extend(lines)
+                self.count += len(lines)
+                yield from lines
+            self.proc.wait()    # EOF: let it exit by itself rather than being killed in close()
+        finally:
+            self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._lines)
+
+    def consume(self):
+        """Run the command to completion, keeping only what keep= retains. Returns the line count."""
+        for line in self._lines:
+            pass
+        return self.count
+
+    @property
+    def returncode(self):
+        return self.proc.poll()
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __repr__(self):
+        state = 'running' if self.proc.poll() is None else 'exit %s' % self.proc.returncode
+        return '<ShellStream %r %s, %d lines>' % (self.cmd, state, self.count)
+
+
+def stream(cmd, keep=None, grep=None, flags=0, chunk=CHUNK):
+    """Start cmd in a shell and return a ShellStream over its output lines."""
+    return ShellStream(cmd, keep, grep, flags, chunk)
@@ -0,0 +1,146 @@
+### Streaming, in-place centering and standardization
+# "Centering an Array" in 2.5-broadcasting.py does X - X.mean(0): one pass for the mean, then a
+# full second copy of X for the result. Standardizer gets the column means and variances in one
+# streaming pass over row blocks (per-block moments merged with Chan's update of Welford's
+# method), then applies (X - mean) / std block by block -- into X itself, into a memmapped .npy,
+# or into a new array. A 50 GB feature matrix in a .npy file is centered with ~BLOCK_BYTES of RAM.
+#
+# usage:
+#   X_centered = center(X)                                  # == X - X.mean(0), new array
+#   center(X, out=X)                                        # in place
+#   standardize('features.npy', out='features_std.npy')    # memmapped in, memmapped out
+#   X = np.load('features.npy', mmap_mode='r+'); standardize(X, out=X)
+#
+#   s = Standardizer()
+#   for chunk in pd.read_csv('big.csv', chunksize=10 ** 6):    # or any iterable of row blocks
+#       s.partial_fit(chunk.values)
+#   s.mean, s.std, s.count
+import numpy as np
+
+BLOCK_BYTES = 64 * 2 ** 20     # rows per block: about this many bytes of input
+
+
+def _open(X, mode='r'):
+    if isinstance(X, str):
+        return np.load(X, mmap_mode=mode)
+    return X
+
+
+def _blocks(X, block_bytes):
+    rows = max(1, block_bytes // max(1, X[:1].nbytes))
+    for r0 in range(0, X.shape[0], rows):
+        yield r0, X[r0:r0 + rows]
+
+
+class Standardizer(object):
+    """Column means / variances from one streaming pass; (X - mean) / std applied block by block."""
+
+    def __init__(self, with_std=True, ddof=0, block_bytes=BLOCK_BYTES):
+        self.with_std = with_std
+        self.ddof = ddof
+        self.block_bytes = block_bytes
+        self.count = 0
+        self.mean = None
+        self.m2 = None          # per-column sum of squared deviations from the mean
+
+    def partial_fit(self, chunk):
+        """Fold a block of rows (samples along axis 0) into the running moments."""
+        chunk = np.asarray(chunk)
+        n = chunk.shape[0]
+        if not n:
+            return self
+        mean = chunk.mean(axis=0, dtype=np.float64)
+        dev = chunk - mean
+        np.multiply(dev, dev, out=dev)
+        m2 = dev.sum(axis=0, dtype=np.float64)
+        if self.mean is None:
+            self.count, self.mean, self.m2 = n, mean, m2
+            return self
+        if mean.shape != self.mean.shape:
+            raise ValueError('chunk has rows of shape %s, expected %s' % (mean.shape, self.mean.shape))
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * (n / total)
+        self.m2 += m2 + delta * delta * (self.count * n / total)
+        self.count = total
+        return self
+
+    def fit(self, X):
+        """X: array, memmap, .npy path, or an iterable of row blocks."""
+        X = _open(X)
+        chunks = (block for r0, block in _blocks(X, self.block_bytes)) if isinstance(X, np.ndarray) else X
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / (self.count - self.ddof)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def scale(self):
+        # constant columns are only centered, like sklearn's StandardScaler
+        std = self.std
+        return np.where(std > 0, std, 1.0)
+
+    def transform(self, X, out=None):
+        """(X - mean) / std (or X - mean if with_std=False), one block of rows at a time.
+
+        out: None (new array), an array / writable memmap (may be X itself), or a .npy path.
+        """
+        if self.mean is None:
+            raise ValueError('call fit() or partial_fit() first')
+        if isinstance(X, str) and isinstance(out, str) and out == X:
+            X = out = np.load(X, mmap_mode='r+')     # same file: work in place
+        X = _open(X)
+        dtype = np.result_type(X.dtype, np.float32)
+        if out is None:
+            out = np.empty(X.shape, dtype)
+        elif isinstance(out, str):
+            out = np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=X.shape)
+        elif out.shape != X.shape:
+            raise ValueError('out has shape %s, expected %s' % (out.shape, X.shape))
+        if not np.issubdtype(out.dtype, np.inexact):
+            raise TypeError('out must be a float array, got %s' % out.dtype)
+        mean = self.mean.astype(out.dtype)
+        scale = self.scale.astype(out.dtype) if self.with_std else None
+        for r0, block in _blocks(X, self.block_bytes):
+            target = out[r0:r0 + len(block)]
+            np.subtract(block, mean, out=target)
+            if scale is not None:
+                np.divide(target, scale, out=target)
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+
+    def fit_transform(self, X, out=None):
+        """fit + transform: X is read twice, so it must be an array, memmap or .npy path."""
+        if not isinstance(X, (str, np.ndarray)):
+            raise TypeError('fit_transform needs an array, memmap or .npy path, got %s; '
+                            'for an iterable of row blocks call partial_fit / fit, then transform '
+                            'each block' % type(X).__name__)
+        return self.fit(X).transform(X, out)
+
+    def inverse_transform(self, X, out=None):
+        X = _open(X)
+        if out is None:
+            out = np.empty(X.shape, np.result_type(X.dtype, np.float32))
+        for r0, block in _blocks(X, self.block_bytes):
+            target = out[r0:r0 + len(block)]
+            np.multiply(block, self.scale if self.with_std else 1.0, out=target)
+            np.add(target, self.mean, out=target)
+        return out
+
+
+def center(X, out=None, block_bytes=BLOCK_BYTES):
+    """X - X.mean(0) in two streaming passes; out=X centers in place."""
+    return Standardizer(with_std=False, block_bytes=block_bytes).fit_transform(X, out)
+
+
+def standardize(X, out=None, ddof=0, block_bytes=BLOCK_BYTES):
+    """(X - X.mean(0)) / X.std(0) in two streaming passes; out=X works in place."""
+    return Standardizer(ddof=ddof, block_bytes=block_bytes).fit_transform(X, out)
@@ -0,0 +1,247 @@
+### Single-pass streaming summary statistics
+# 2.4-aggregations.py gets mean, std, min, max, median and the 25/75th percentiles of big_array
+# (and of the president heights) with one full pass over the data per statistic. A Summary
+# consumes the data chunk by chunk instead -- arrays, memmaps, or pandas read_csv(chunksize=...)
+# readers -- and updates everything in that single pass:
+#   count / mean / variance   Welford-style: per-chunk mean and M2, merged with Chan's formula
+#   sum                       Kahan-compensated across chunks (pairwise np.sum inside a chunk)
+#   min / max                 running
+#   quantiles                 KLL sketch: bounded rank error, mergeable
+# Two Summaries merge exactly (moments) or within the sketch bound (quantiles), so partial
+# results from separate processes can be combined; summarize_npy() does exactly that.
+#
+# usage:
+#   s = summarize(big_array)                         # chunks over an array / memmap
+#   s.describe()                                     # {'count':..., 'mean':..., '25%':..., ...}
+#   s = summarize(pd.read_csv('data/president_heights.csv', chunksize=10), column='height(cm)')
+#   s.quantile([0.25, 0.5, 0.75])
+#   s.merge(other)                                   # in place; other may come from another process
+#   summarize_npy('big.npy', workers=4)              # one Summary per slice, merged
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+CHUNK = 1 << 20
+K = 200     # KLL accuracy parameter; ~1.3% rank error at k=200, ~0.3% at k=1000
+
+
+class KLLSketch(object):
+    """Mergeable quantile sketch (Karnin, Lang & Liberty 2016).
+
+    Level h holds items of weight 2**h. A level over its capacity is sorted and halved (a random
+    one of the two interleavings survives) into the level above; capacities shrink by 2/3 per
+    level going down, so the sketch holds O(k) items whatever the stream length.
+    """
+
+    def __init__(self, k=K, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.RandomState(seed)
+
+    @property
+    def rank_error(self):
+        # normalized rank error at ~99% confidence (empirical fit from the DataSketches library)
+        return 2.296 / self.k ** 0.9723
+
+    @property
+    def exact(self):
+        return len(self.levels) == 1    # nothing compacted yet: level 0 is the whole stream
+
+    def _capacity(self, h):
+        depth = len(self.levels) - 1 - h
+        return max(2, int(np.ceil(self.k * (2 / 3.) ** depth)))
+
+    def _compress(self):
+        # compact the lowest over-full level until none is; growing a level shrinks the
+        # capacities below it, so rescan from the bottom each time
+        while True:
+            full = [h for h, level in enumerate(self.levels) if len(level) > self._capacity(h)]
+            if not full:
+                return
+            h = full[0]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            level = np.sort(self.levels[h])
+            # odd count: one item stays behind so total weight is preserved
+            stay, level = level[:len(level) % 2], level[len(level) % 2:]
+            promoted = level[self._rng.randint(2)::2]
+            self.levels[h] = stay
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).reshape(-1)
+        if values.size:
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self.n += values.size
+            self._compress()
+
+    def merge(self, other):
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        q = np.asarray(q, dtype=float)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+        if self.exact:
+            return np.quantile(self.levels[0], q)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cum = np.cumsum(weights[order])
+        idx = np.searchsorted(cum, q * self.n, side='left')
+        return items[order][np.minimum(idx, len(items) - 1)]
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
+
+
+class Summary(object):
+    """Running count, mean, variance, sum, min, max and quantiles over a stream of chunks."""
+
+    def __init__(self, k=K, seed=None):
+        self.count = 0
+        self.nan_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0           # sum of squared deviations from the mean
+        self._sum = 0.0
+        self._comp = 0.0        # Kahan compensation for _sum
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = KLLSketch(k, seed)
+
+    def _add_sum(self, value):
+        y = value - self._comp
+        t = self._sum + y
+        self._comp = (t - self._sum) - y
+        self._sum = t
+
+    def _combine(self, n, mean, m2):
+        # Chan et al.: merge (count, mean, M2) of two disjoint parts
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    def update(self, chunk):
+        x = np.asarray(chunk, dtype=float).reshape(-1)
+        nan = np.isnan(x)
+        if nan.any():
+            self.nan_count += int(nan.sum())
+            x = x[~nan]
+        if not x.size:
+            return self
+        s = float(np.sum(x))
+        mean = s / x.size
+        d = x - mean
+        self._combine(x.size, mean, float(np.dot(d, d)))
+        self._add_sum(s)
+        self.min = min(self.min, float(x.min()))
+        self.max = max(self.max, float(x.max()))
+        self.sketch.update(x)
+        return self
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+            self._add_sum(other._sum)
+            self._add_sum(-other._comp)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.nan_count += other.nan_count
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def sum(self):
+        return self._sum - self._comp
+
+    def var(self, ddof=0):
+        return self.m2 / (self.count - ddof) if self.count > ddof else np.nan
+
+    def std(self, ddof=0):
+        return np.sqrt(self.var(ddof))
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def percentile(self, p):
+        return self.quantile(np.asarray(p, dtype=float) / 100)
+
+    def median(self):
+        return float(self.quantile(0.5))
+
+    def describe(self, quantiles=(0.25, 0.5, 0.75)):
+        d = {'count': self.count, 'mean': self.mean if self.count else np.nan,
+             'std': self.std(), 'min': self.min, 'max': self.max, 'sum': self.sum}
+        for q, v in zip(quantiles, self.quantile(quantiles)):
+            d['%g%%' % (q * 100)] = float(v)
+        d['nan_count'] = self.nan_count
+        d['quantile_rank_error'] = 0.0 if self.sketch.exact else self.sketch.rank_error
+        return d
+
+    def __repr__(self):
+        return '<Summary count=%d mean=%.6g std=%.6g>' % (self.count, self.mean, self.std())
+
+
+##############################
+### Sources
+def iter_chunks(source, chunk=CHUNK, column=None):
+    """Yield 1-D float chunks from an array / memmap, a DataFrame reader, or any iterable."""
+    if isinstance(source, np.ndarray):
+        flat = source.reshape(-1)   # memmaps stay mapped; only each slice gets read
+        for lo in range(0, flat.size, chunk):
+            yield flat[lo:lo + chunk]
+        return
+    for part in source:
+        if column is not None:
+            part = part[column]
+        yield np.asarray(part, dtype=float)
+
+
+def summarize(source, chunk=CHUNK, column=None, k=K, seed=None):
+    s = Summary(k, seed)
+    for part in iter_chunks(source, chunk, column):
+        s.update(part)
+    return s
+
+
+def _summarize_slice(path, start, stop, chunk, k, seed):
+    flat = np.load(path, mmap_mode='r').reshape(-1)
+    return summarize(flat[start:stop], chunk, k=k, seed=seed)
+
+
+def summarize_npy(path, workers=None, chunk=CHUNK, k=K):
+    """Summary of a .npy file: one slice per process, partial Summaries merged."""
+    n = np.load(path, mmap_mode='r').size
+    workers = workers or os.cpu_count() or 1
+    step = -(-n // workers) or 1
+    bounds = [(lo, min(lo + step, n)) for lo in range(0, n, step)]
+    with ProcessPoolExecutor(workers) as pool:
+        parts = list(pool.map(_summarize_slice, [path] * len(bounds), *zip(*bounds),
+                              [chunk] * len(bounds), [k] * len(bounds), range(len(bounds))))
+    total = Summary(k)
+    for part in parts:
+        total.merge(part)
+    return total
+
+
+if __name__ == '__main__':
+    big_array = np.random.rand(10 ** 7)
+    s = summarize(big_array)
+    exact = np.percentile(big_array, [25, 50, 75])
+    print('%-8s %14s %14s' % ('', 'streaming', 'numpy'))
+    for name, mine, ref in [('mean', s.mean, big_array.mean()), ('std', s.std(), big_array.std()),
+                            ('min', s.min, big_array.min()), ('max', s.max, big_array.max()),
+                            ('25%', s.percentile(25), exact[0]), ('50%', s.median(), exact[1]),
+                            ('75%', s.percentile(75), exact[2])]:
+        print('%-8s %14.8f %14.8f' % (name, mine, ref))
+    print('sketch: %d items for n=%d, rank error <= %.3g' % (len(s.sketch), s.count, s.sketch.rank_error))
@@ -0,0 +1,155 @@
+### Tiled ufunc.outer for results too big to materialize
+# np.multiply.outer(x, x) (2.3-npUFuncs.py) builds the full N x N matrix: 320 GB for N = 200k.
+# Usually the matrix is only an intermediate for some per-row / per-column answer (sums, max,
+# nearest neighbours...). This computes it one tile at a time into a reused buffer, either
+# handing the tiles to the caller or reducing them on the fly, with tile stripes spread over
+# a thread pool (ufunc loops release the GIL).
+#
+# usage:
+#   for (i0, i1), (j0, j1), block in outer_tiles(np.multiply, x, x):
+#       ...                                              # block == outer(x, x)[i0:i1, j0:j1]
+#   row_sums = outer_reduce(np.multiply, x, x, 'sum')    # == np.multiply.outer(x, x).sum(1)
+#   col_max = outer_reduce(np.subtract, x, y, 'max', axis=0)
+#   vals, idx = outer_topk(np.subtract, x, y, k=5, largest=False)   # 5 smallest per row
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TILE_BYTES = 8 * 2 ** 20    # one tile buffer per worker
+
+# name -> (per-tile reduction along an axis, how two partial results combine)
+REDUCTIONS = {
+    'sum': (np.add.reduce, np.add),
+    'max': (np.maximum.reduce, np.maximum),
+    'min': (np.minimum.reduce, np.minimum),
+}
+
+
+def _tile_shape(n, m, itemsize, tile_bytes):
+    side = max(1, int((tile_bytes // itemsize) ** 0.5))
+    return min(n, side), min(m, side)
+
+
+def _result_dtype(ufunc, x, y):
+    return ufunc(x[:1], y[:1]).dtype
+
+
+def outer_tiles(ufunc, x, y, tile=None, tile_bytes=TILE_BYTES):
+    """Yield ((i0, i1), (j0, j1), block) covering ufunc.outer(x, y), row-major.
+
+    block is a view of one reused buffer: copy it if you need it after the next iteration.
+    """
+    x, y = np.ravel(x), np.ravel(y)
+    dtype = _result_dtype(ufunc, x, y)
+    rows, cols = tile or _tile_shape(len(x), len(y), dtype.itemsize, tile_bytes)
+    buf = np.empty((rows, cols), dtype)
+    for i0 in range(0, len(x), rows):
+        i1 = min(i0 + rows, len(x))
+        for j0 in range(0, len(y), cols):
+            j1 = min(j0 + cols, len(y))
+            block = buf[:i1 - i0, :j1 - j0]
+            ufunc(x[i0:i1, None], y[None, j0:j1], out=block)
+            yield (i0, i1), (j0, j1), block
+
+
+def _stripes(ufunc, x, y, axis, tile, tile_bytes, workers, reduce_stripe):
+    # Split the kept axis into stripes; each task owns one stripe and walks the reduced axis tile
+    # by tile, so partial results never need locking.
+    x, y = np.ravel(x), np.ravel(y)
+    if axis == 0:
+        # outer(x, y).reduce(axis=0): stripes over y, tiles walk down x
+        keep, walk = y, x
+    else:
+        keep, walk = x, y
+    dtype = _result_dtype(ufunc, x, y)
+    rows, cols = tile or _tile_shape(len(keep), len(walk), dtype.itemsize, tile_bytes)
+
+    def task(k0):
+        k1 = min(k0 + rows, len(keep))
+        buf = np.empty((k1 - k0, cols), dtype)
+        acc = None
+        for w0 in range(0, len(walk), cols):
+            w1 = min(w0 + cols, len(walk))
+            block = buf[:, :w1 - w0]
+            if axis == 0:
+                # block[j, i] = ufunc(x[i], y[j]): keeps the operand order of ufunc.outer(x, y)
+                ufunc(walk[None, w0:w1], keep[k0:k1, None], out=block)
+            else:
+                ufunc(keep[k0:k1, None], walk[None, w0:w1], out=block)
+            acc = reduce_stripe(acc, block, w0)
+        return k0, k1, acc
+
+    starts = range(0, len(keep), rows)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(starts) == 1:
+        return [task(k0) for k0 in starts]
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(task, starts))
+
+
+def outer_reduce(ufunc, x, y, reduction='sum', axis=1, tile=None, tile_bytes=TILE_BYTES, workers=None):
+    """ufunc.outer(x, y) reduced along axis (0, 1 or None) without building it.
+
+    reduction: 'sum', 'max', 'min', 'mean', or a (tile_reduce(block, axis), combine(a, b)) pair.
+    """
+    name = reduction if isinstance(reduction, str) else None
+    if name == 'mean':
+        total = outer_reduce(ufunc, x, y, 'sum', axis, tile, tile_bytes, workers)
+        count = np.size(x) * np.size(y) if axis is None else (np.size(y) if axis == 1 else np.size(x))
+        return total / count
+    tile_reduce, combine = REDUCTIONS[name] if name else reduction
+
+    def reduce_stripe(acc, block, offset):
+        part = tile_reduce(block, axis=1)       # block rows are always the kept axis
+        return part.copy() if acc is None else combine(acc, part)
+
+    # axis=None: reduce per row first, then over the row results
+    parts = _stripes(ufunc, x, y, 1 if axis is None else axis, tile, tile_bytes, workers, reduce_stripe)
+    result = np.concatenate([acc for k0, k1, acc in parts])
+    if axis is None:
+        return tile_reduce(result, axis=0)
+    return result
+
+
+def _pick(vals, kk, largest):
+    # column indices of the kk largest / smallest values of each row, in no particular order
+    # (partitioning from the end for largest: negating would overflow unsigned dtypes)
+    n = vals.shape[1]
+    if kk == 0:
+        return np.empty((vals.shape[0], 0), np.intp)
+    if largest:
+        return np.argpartition(vals, n - kk, axis=1)[:, n - kk:]
+    return np.argpartition(vals, kk - 1, axis=1)[:, :kk]
+
+
+def outer_topk(ufunc, x, y, k, largest=True, axis=1, tile=None, tile_bytes=TILE_BYTES, workers=None):
+    """Top-k values and their indices along axis of ufunc.outer(x, y), tile by tile.
+
+    Returns (values, indices), each shaped (len kept axis, k), best first.
+    """
+    n_walk = np.size(y) if axis == 1 else np.size(x)
+    k = min(k, n_walk)
+
+    def reduce_stripe(acc, block, offset):
+        idx = _pick(block, min(k, block.shape[1]), largest)
+        cand_v = np.take_along_axis(block, idx, axis=1)
+        cand_i = idx + offset
+        if acc is not None:
+            cand_v = np.concatenate([acc[0], cand_v], axis=1)
+            cand_i = np.concatenate([acc[1], cand_i], axis=1)
+            if cand_v.shape[1] > k:
+                keep = _pick(cand_v, k, largest)
+                cand_v = np.take_along_axis(cand_v, keep, axis=1)
+                cand_i = np.take_along_axis(cand_i, keep, axis=1)
+        return cand_v, cand_i
+
+    parts = _stripes(ufunc, x, y, axis, tile, tile_bytes, workers, reduce_stripe)
+    vals = np.concatenate([acc[0] for k0, k1, acc in parts])
+    idx = np.concatenate([acc[1] for k0, k1, acc in parts])
+    if largest:
+        # descending, ties in candidate order: stable ascending sort of the reversed columns, reversed
+        order = vals.shape[1] - 1 - np.argsort(vals[:, ::-1], axis=1, kind='stable')[:, ::-1]
+    else:
+        order = np.argsort(vals, axis=1, kind='stable')
+    return np.take_along_axis(vals, order, axis=1), np.take_along_axis(idx, order, axis=1)
@@ -0,0 +1,207 @@
+### Headless benchmarks for the %timeit / %prun snippets
+# The timing examples in 1.3-magic.py and 1.7-timeExec.py only run inside iPython.
+# This module registers the same cases as plain functions, times them with the
+# stdlib timeit module and keeps a JSON history so slowdowns between runs get flagged.
+#
+# usage:
+#   python timeit_bench.py                    # run everything, compare vs last run of each case
+#   python timeit_bench.py -k sort -r 7       # only cases matching 'sort', 7 repeats
+import argparse
+import json
+import os
+import platform
+import random
+import time
+import timeit
+
+from mprun_demo import sum_of_lists, sum_of_lists_np
+
+HISTORY_FILE = 'bench_history.json'
+REGISTRY = {}   # { name: (case_factory, params) }
+
+
+def benchmark(name, params=(None,)):
+    """Register a case factory; it is called once per value in params and returns stmt or (stmt, setup)."""
+    def decorator(factory):
+        REGISTRY[name] = (factory, tuple(params))
+        return factory
+    return decorator
+
+
+##############################
+### Cases from 1.3-magic.py
+# %timeit L = [n ** 2 for n in range(1000)]   vs   the append loop
+@benchmark('listcomp_squares', params=[1000, 100000])
+def listcomp_squares(n):
+    def stmt():
+        L = [i ** 2 for i in range(n)]
+    return stmt
+
+
+@benchmark('append_loop_squares', params=[1000, 100000])
+def append_loop_squares(n):
+    def stmt():
+        L = []
+        for i in range(n):
+            L.append(i ** 2)
+    return stmt
+
+
+##############################
+### Cases from 1.7-timeExec.py
+# %timeit L.sort() twice in a row --- the second call sorts already sorted data.
+# 'fresh' reshuffles before every call (shuffle is outside the timed region), 'presorted' doesn't.
+@benchmark('sort_fresh', params=[100000])
+def sort_fresh(n):
+    L = [random.random() for i in range(n)]
+    def stmt():
+        L.sort()
+    def setup():
+        random.shuffle(L)
+    return stmt, setup
+
+
+@benchmark('sort_presorted', params=[100000])
+def sort_presorted(n):
+    L = sorted(random.random() for i in range(n))
+    def stmt():
+        L.sort()
+    return stmt
+
+
+# %prun sum_of_lists(1000000)
+@benchmark('sum_of_lists', params=[5000, 100000, 1000000])
+def sum_of_lists_case(n):
+    def stmt():
+        sum_of_lists(n)
+    return stmt
+
+
+@benchmark('sum_of_lists_np', params=[5000, 100000, 1000000])
+def sum_of_lists_np_case(n):
+    def stmt():
+        sum_of_lists_np(n)
+    return stmt
+
+
+##############################
+### Running
+def _time_case(stmt, setup, number, repeat, warmup):
+    # setup runs outside the timed region, once per loop (like %timeit -n 1 with a fresh setup)
+    for i in range(warmup):
+        if setup is not None:
+            setup()
+        stmt()
+    timer = timeit.default_timer
+    times = []
+    for r in range(repeat):
+        total = 0.0
+        for i in range(number):
+            if setup is not None:
+                setup()
+            t0 = timer()
+            stmt()
+            total += timer() - t0
+        times.append(total / number)
+    return times
+
+
+def _autorange(stmt, setup, target=0.2):
+    # same idea as %timeit picking its loop count: grow until one repeat takes ~target seconds
+    number = 1
+    while True:
+        t = sum(_time_case(stmt, setup, number, 1, 0))
+        if t * number >= target or number >= 10 ** 6:
+            return number
+        number *= 10
+
+
+def run(pattern=None, repeat=5, warmup=1, number=None):
+    """Run registered benchmarks, return { 'name[param]': stats }."""
+    results = {}
+    for name, (factory, params) in REGISTRY.items():
+        if pattern and pattern not in name:
+            continue
+        for p in params:
+            case = factory(p) if p is not None else factory()
+            stmt, setup = case if isinstance(case, tuple) else (case, None)
+            n = number or _autorange(stmt, setup)
+            times = _time_case(stmt, setup, n, repeat, warmup)
+            key = name if p is None else '%s[%s]' % (name, p)
+            results[key] = {'best': min(times),
+                            'mean': sum(times) / len(times),
+                            'loops': n,
+                            'repeat': repeat}
+    return results
+
+
+##############################
+### JSON history + regression check
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_run(results, path=HISTORY_FILE):
+    history = load_history(path)
+    history.append({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'results': results})
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=1)
+    return history
+
+
+def find_regressions(results, history, threshold=0.10):
+    """Compare best times against the latest prior run of each case, return slowdowns above threshold."""
+    regressions = {}
+    for key, stats in results.items():
+        previous = next((run['results'][key] for run in reversed(history) if key in run['results']), None)
+        if previous is None:
+            continue
+        old, new = previous['best'], stats['best']
+        if old > 0 and (new - old) / old > threshold:
+            regressions[key] = (old, new)
+    return regressions
+
+
+def _fmt(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6), ('ns', 1e9)):
+        if seconds * scale >= 1:
+            return '%.3g %s' % (seconds * scale, unit)
+    return '%.3g ns' % (seconds * 1e9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run the registered timing cases')
+    parser.add_argument('-k', dest='pattern', help='only run cases whose name contains this')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-w', '--warmup', type=int, default=1)
+    parser.add_argument('-n', '--number', type=int, help='loops per repeat (default: auto)')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown vs the previous run that counts as a regression')
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = run(args.pattern, args.repeat, args.warmup, args.number)
+    history = load_history(args.history)
+    regressions = find_regressions(results, history, args.threshold)
+
+    for key, stats in results.items():
+        flag = '  <-- REGRESSION' if key in regressions else ''
+        print('%-32s %10s per loop (best of %d, %d loops)%s'
+              % (key, _fmt(stats['best']), stats['repeat'], stats['loops'], flag))
+    for key, (old, new) in regressions.items():
+        print('regressed: %s  %s -> %s (+%.0f%%)' % (key, _fmt(old), _fmt(new), 100 * (new - old) / old))
+
+    if not args.no_save:
+        save_run(results, args.history)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
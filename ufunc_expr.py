@@ -0,0 +1,249 @@
+### Tiled evaluation of compound ufunc expressions
+# In 2.3-npUFuncs.py, -(0.5*x + 1) ** 2 allocates a full-size temporary for 0.5*x, another for
+# (... + 1), another for (...) ** 2, and one more for the negation. Wrapping x in an Expr records
+# the expression instead of running it; evaluate() then runs the whole expression one tile at a
+# time, so each intermediate is a tile-sized scratch buffer (kept in L2 cache) and the buffers are
+# reused from tile to tile and from node to node.
+#
+# usage:
+#   x = wrap(np.arange(10 ** 7, dtype=float))
+#   e = -(0.5 * x + 1) ** 2              # nothing computed yet
+#   y = e.evaluate()                     # == -(0.5*x.value + 1) ** 2
+#   z = np.sin(x) ** 10 + np.cos(x)      # numpy ufuncs on Exprs build nodes too
+#   e.report()                           # {'naive_bytes': ..., 'tiled_bytes': ..., ...}
+import numpy as np
+
+L2_BYTES = 1 << 20      # cache to fit one tile's worth of scratch buffers into
+
+
+class Expr(object):
+    """Node of a recorded ufunc expression: ufunc applied to child Exprs / scalars."""
+
+    __array_priority__ = 100    # so ndarray <op> Expr defers to our reflected operators
+
+    def __init__(self, ufunc, args):
+        self.ufunc = ufunc
+        self.args = args
+
+    # --- building the DAG
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or kwargs or ufunc.nout != 1:
+            return NotImplemented
+        return Expr(ufunc, [_as_node(a) for a in inputs])
+
+    def _bin(ufunc, reflected=False):
+        if reflected:
+            return lambda self, other: Expr(ufunc, [_as_node(other), self])
+        return lambda self, other: Expr(ufunc, [self, _as_node(other)])
+
+    __add__, __radd__ = _bin(np.add), _bin(np.add, True)
+    __sub__, __rsub__ = _bin(np.subtract), _bin(np.subtract, True)
+    __mul__, __rmul__ = _bin(np.multiply), _bin(np.multiply, True)
+    __truediv__, __rtruediv__ = _bin(np.true_divide), _bin(np.true_divide, True)
+    __floordiv__, __rfloordiv__ = _bin(np.floor_divide), _bin(np.floor_divide, True)
+    __mod__, __rmod__ = _bin(np.remainder), _bin(np.remainder, True)
+    __pow__, __rpow__ = _bin(np.power), _bin(np.power, True)
+    __lt__, __le__ = _bin(np.less), _bin(np.less_equal)
+    __gt__, __ge__ = _bin(np.greater), _bin(np.greater_equal)
+    __eq__, __ne__ = _bin(np.equal), _bin(np.not_equal)
+    __hash__ = object.__hash__      # == builds a node; planning keys nodes by id() anyway
+    __and__, __rand__ = _bin(np.bitwise_and), _bin(np.bitwise_and, True)
+    __or__, __ror__ = _bin(np.bitwise_or), _bin(np.bitwise_or, True)
+    __xor__, __rxor__ = _bin(np.bitwise_xor), _bin(np.bitwise_xor, True)
+    del _bin
+
+    def __neg__(self):
+        return Expr(np.negative, [self])
+
+    def __abs__(self):
+        return Expr(np.absolute, [self])
+
+    def __invert__(self):
+        return Expr(np.invert, [self])
+
+    def __repr__(self):
+        return '%s(%s)' % (self.ufunc.__name__, ', '.join(map(repr, self.args)))
+
+    # --- evaluation
+    def evaluate(self, out=None, tile=None):
+        return evaluate(self, out, tile)
+
+    def report(self, tile=None):
+        return allocation_report(self, tile)
+
+
+class Leaf(Expr):
+    """An input array in an expression."""
+
+    def __init__(self, value):
+        self.value = np.ascontiguousarray(value)
+        self.ufunc, self.args = None, []
+
+    def __repr__(self):
+        return 'array%s' % (self.value.shape,)
+
+
+def wrap(array):
+    return Leaf(array)
+
+
+def _as_node(x):
+    if isinstance(x, Expr):
+        return x
+    if isinstance(x, np.ndarray) and x.ndim > 0:
+        return Leaf(x)
+    return x    # scalar: passed straight to the ufunc
+
+
+##############################
+### Planning
+def _topo(root):
+    # unique internal nodes in evaluation order, and how many times each is consumed
+    # (iterative post-order walk: expressions built in a loop can be thousands of nodes deep)
+    order, uses, seen = [], {}, set()
+    stack = [(root, False)]
+    while stack:
+        node, inputs_done = stack.pop()
+        if inputs_done:
+            order.append(node)
+            continue
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.append((node, True))
+        for a in reversed(node.args):
+            if isinstance(a, Expr) and not isinstance(a, Leaf):
+                uses[id(a)] = uses.get(id(a), 0) + 1
+                stack.append((a, False))
+    return order, uses
+
+
+def _leaves(root):
+    found, stack, seen = [], [root], set()
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, Leaf):
+            found.append(node)
+        else:
+            stack.extend(a for a in node.args if isinstance(a, Expr))
+    return found
+
+
+def _dtypes(order):
+    # result dtype of every node, from a one-element run of the expression
+    probe = {}
+
+    def val(a):
+        if isinstance(a, Leaf):
+            return a.value.reshape(-1)[:1]
+        return probe[id(a)] if isinstance(a, Expr) else a
+
+    for node in order:
+        probe[id(node)] = node.ufunc(*[val(a) for a in node.args])
+    return {k: v.dtype for k, v in probe.items()}
+
+
+def _plan(root):
+    """Assign scratch buffer slots so nodes reuse buffers freed by their inputs."""
+    order, uses = _topo(root)
+    dtypes = _dtypes(order)
+    slots = {}          # { id(node): slot index }, root excluded (it writes into out)
+    slot_dtype = []
+    free = []
+    remaining = dict(uses)
+    for node in order:
+        # release inputs first: elementwise ufuncs may safely write over an input in place
+        for a in node.args:
+            if isinstance(a, Expr) and id(a) in slots:
+                remaining[id(a)] -= 1
+                if remaining[id(a)] == 0:
+                    free.append(slots[id(a)])
+        if node is root:
+            continue
+        dtype = dtypes[id(node)]
+        match = [s for s in free if slot_dtype[s] == dtype]
+        if match:
+            slot = match[0]
+            free.remove(slot)
+        else:
+            slot = len(slot_dtype)
+            slot_dtype.append(dtype)
+        slots[id(node)] = slot
+    return order, slots, slot_dtype, dtypes[id(root)]
+
+
+def _shape(root):
+    leaves = _leaves(root)
+    if not leaves:
+        raise ValueError('expression has no array inputs')
+    shape = leaves[0].value.shape
+    for leaf in leaves:
+        if leaf.value.shape != shape:
+            raise ValueError('inputs must share one shape, got %s and %s' % (shape, leaf.value.shape))
+    return shape
+
+
+def _tile_size(slot_dtype, out_dtype, n_leaves):
+    # bytes touched per element within a tile: scratch buffers + output + one read per input
+    per_element = sum(d.itemsize for d in slot_dtype) + out_dtype.itemsize + 8 * n_leaves
+    return max(1024, L2_BYTES // per_element)
+
+
+##############################
+### Evaluation
+def evaluate(root, out=None, tile=None):
+    """Evaluate expression root tile by tile; returns out (allocated if None)."""
+    if isinstance(root, Leaf):
+        return root.value.copy() if out is None else np.copyto(out, root.value) or out
+    shape = _shape(root)
+    order, slots, slot_dtype, out_dtype = _plan(root)
+    if out is None:
+        out = np.empty(shape, out_dtype)
+    elif out.shape != shape or not out.flags.c_contiguous:
+        raise ValueError('out must be C-contiguous with shape %s' % (shape,))
+    n = out.size
+    if n == 0:
+        return out
+    tile = tile or _tile_size(slot_dtype, out_dtype, len(_leaves(root)))
+    tile = min(tile, n)
+    buffers = [np.empty(tile, d) for d in slot_dtype]
+    flat_out = out.reshape(-1)
+    flat_leaves = {id(leaf): leaf.value.reshape(-1) for leaf in _leaves(root)}
+
+    for lo in range(0, n, tile):
+        hi = min(lo + tile, n)
+        m = hi - lo
+        values = {}
+        for node in order:
+            args = []
+            for a in node.args:
+                if isinstance(a, Leaf):
+                    args.append(flat_leaves[id(a)][lo:hi])
+                elif isinstance(a, Expr):
+                    args.append(values[id(a)])
+                else:
+                    args.append(a)
+            target = flat_out[lo:hi] if node is root else buffers[slots[id(node)]][:m]
+            values[id(node)] = node.ufunc(*args, out=target)
+    return out
+
+
+def allocation_report(root, tile=None):
+    """Bytes allocated by plain NumPy evaluation vs. tiled evaluation of root."""
+    shape = _shape(root)
+    n = int(np.prod(shape))
+    order, slots, slot_dtype, out_dtype = _plan(root)
+    dtypes = _dtypes(order)
+    tile = min(tile or _tile_size(slot_dtype, out_dtype, len(_leaves(root))), n)
+    naive = sum(n * dtypes[id(node)].itemsize for node in order)    # a full array per node
+    scratch = sum(tile * d.itemsize for d in slot_dtype)
+    return {'elements': n,
+            'nodes': len(order),
+            'naive_bytes': naive,
+            'tiled_bytes': scratch + n * out_dtype.itemsize,
+            'scratch_buffers': len(slot_dtype),
+            'scratch_bytes': scratch,
+            'tile': tile}
@@ -0,0 +1,157 @@
+### Verbose tracebacks with a cost limit
+# %xmode Verbose (1.6-errorsDebug.py) repr()s every local of every frame. With a 1e8-element
+# array or a wide DataFrame in scope that takes seconds and megabytes.
+# This formatter shows the same locals-per-frame view but:
+#   - arrays    -> shape, dtype and min/max/mean of a strided sample (never a full pass)
+#   - frames    -> shape, a few column names and dtype counts
+#   - containers / everything else -> reprlib, cut off at max_repr characters; dicts and sets
+#     show their first items unsorted, other objects with more than BIG_LEN items only their len
+#   - once time_limit seconds are used up, remaining locals are listed by type only
+#
+# usage:
+#   import verbose_tb; verbose_tb.install()                # sys.excepthook
+#   verbose_tb.install(get_ipython())                       # iPython shell
+#   print(verbose_tb.format_exception(exc, max_repr=120))   # by hand
+import linecache
+import reprlib
+import sys
+import time
+import traceback
+from itertools import islice
+
+MAX_REPR = 200
+TIME_LIMIT = 0.5        # seconds for formatting all locals together
+SAMPLE = 10000          # elements looked at for array stats
+BIG_LEN = 1000          # sized objects longer than this are not repr()ed at all
+
+
+def _array_summary(arr):
+    text = '%s shape=%s dtype=%s' % (type(arr).__name__, arr.shape, arr.dtype)
+    if arr.size == 0 or arr.dtype.kind not in 'biuf':
+        return text
+    # stride each axis separately: flattening a transposed / sliced array would copy all of it
+    k = max(1, int(SAMPLE ** (1.0 / arr.ndim)))
+    sample = arr[tuple(slice(None, None, max(1, s // k)) for s in arr.shape)]
+    sampled = ' (sampled 1/%d)' % (arr.size // sample.size) if sample.size < arr.size else ''
+    try:
+        return '%s min=%.4g max=%.4g mean=%.4g%s' % (text, sample.min(), sample.max(), sample.mean(), sampled)
+    except (TypeError, ValueError):
+        return text
+
+
+def _frame_summary(df):
+    columns = list(df.columns[:5])
+    more = ', ...+%d' % (len(df.columns) - 5) if len(df.columns) > 5 else ''
+    dtypes = df.dtypes.astype(str).value_counts()
+    return '%s shape=%s columns=[%s%s] dtypes={%s}' % (
+        type(df).__name__, df.shape, ', '.join(map(repr, columns)), more,
+        ', '.join('%s: %d' % kv for kv in dtypes.items()))
+
+
+def _series_summary(s):
+    return '%s name=%r len=%d dtype=%s' % (type(s).__name__, s.name, len(s), s.dtype)
+
+
+class _BoundedRepr(reprlib.Repr):
+    # reprlib sorts a whole dict / set before cutting it off, and repr_instance builds the full
+    # repr() first: both cost O(len) per frame holding the value
+
+    def __init__(self, max_repr):
+        reprlib.Repr.__init__(self)
+        self.maxstring = self.maxother = max_repr
+        self.maxlist = self.maxtuple = self.maxset = self.maxdict = self.maxdeque = self.maxarray = 10
+        self.maxfrozenset = 10
+        self.maxlevel = 3
+
+    def _items(self, x, limit, fmt):
+        pieces = [fmt(item) for item in islice(x, limit)]
+        if len(x) > limit:
+            pieces.append('...')
+        return ', '.join(pieces)
+
+    def repr_dict(self, x, level):
+        if not x:
+            return '{}'
+        if level <= 0:
+            return '{...}'
+        return '{%s}' % self._items(x.items(), self.maxdict, lambda kv: '%s: %s' % (
+            self.repr1(kv[0], level - 1), self.repr1(kv[1], level - 1)))
+
+    def repr_set(self, x, level):
+        if not x:
+            return 'set()'
+        if level <= 0:
+            return '{...}'
+        return '{%s}' % self._items(x, self.maxset, lambda v: self.repr1(v, level - 1))
+
+    def repr_frozenset(self, x, level):
+        if not x:
+            return 'frozenset()'
+        if level <= 0:
+            return 'frozenset({...})'
+        return 'frozenset({%s})' % self._items(x, self.maxfrozenset, lambda v: self.repr1(v, level - 1))
+
+    def repr_instance(self, x, level):
+        try:
+            n = len(x)
+        except Exception:
+            n = None
+        if n is not None and n > BIG_LEN:
+            return '<%s len=%d>' % (type(x).__name__, n)
+        return reprlib.Repr.repr_instance(self, x, level)
+
+
+def safe_repr(value, max_repr=MAX_REPR):
+    """Cheap, bounded repr: summaries for arrays / DataFrames, truncated reprlib otherwise."""
+    module = type(value).__module__ or ''
+    try:
+        if module.startswith('numpy') and hasattr(value, 'shape') and hasattr(value, 'dtype'):
+            if getattr(value, 'ndim', 0) == 0:
+                return repr(value)[:max_repr]
+            return _array_summary(value)[:max_repr]
+        if module.startswith('pandas'):
+            if hasattr(value, 'columns') and hasattr(value, 'dtypes'):
+                return _frame_summary(value)[:max_repr]
+            if hasattr(value, 'dtype') and hasattr(value, 'index'):
+                return _series_summary(value)[:max_repr]
+        text = _BoundedRepr(max_repr).repr(value)
+    except Exception as e:
+        text = '<repr failed: %s>' % type(e).__name__
+    return text if len(text) <= max_repr else text[:max_repr - 3] + '...'
+
+
+def format_exception(exc, max_repr=MAX_REPR, time_limit=TIME_LIMIT, context=1):
+    """Verbose-mode traceback text for exc with bounded per-value and total formatting cost."""
+    deadline = time.perf_counter() + time_limit
+    lines = ['Traceback (most recent call last):']
+    for frame, lineno in traceback.walk_tb(exc.__traceback__):
+        code = frame.f_code
+        lines.append('  File "%s", line %d, in %s' % (code.co_filename, lineno, code.co_name))
+        for n in range(lineno - context, lineno + context + 1):
+            text = linecache.getline(code.co_filename, n, frame.f_globals).rstrip()
+            if text:
+                lines.append('%s %5d %s' % ('-->' if n == lineno else '   ', n, text))
+        for name, value in frame.f_locals.items():
+            if name.startswith('__') and name.endswith('__'):
+                continue
+            if time.perf_counter() > deadline:
+                lines.append('        %s = <%s, not shown: time limit>' % (name, type(value).__name__))
+            else:
+                lines.append('        %s = %s' % (name, safe_repr(value, max_repr)))
+    lines.extend(l.rstrip('\n') for l in traceback.format_exception_only(type(exc), exc))
+    return '\n'.join(lines)
+
+
+def install(ip=None, max_repr=MAX_REPR, time_limit=TIME_LIMIT):
+    """Use the bounded formatter for uncaught exceptions (sys.excepthook, or iPython shell ip)."""
+    if ip is None:
+        def hook(etype, value, tb):
+            sys.stderr.write(format_exception(value.with_traceback(tb), max_repr, time_limit) + '\n')
+        sys.excepthook = hook
+        return hook
+
+    def handler(shell, etype, value, tb, tb_offset=None):
+        sys.stderr.write(format_exception(value.with_traceback(tb), max_repr, time_limit) + '\n')
+
+    ip.set_custom_exc((Exception,), handler)
+    return handler